@@ -14,9 +14,28 @@ import seaborn as sns
 import matplotlib.pyplot as plt
 from matplotlib.colors import LinearSegmentedColormap
 import base64
-import re
 import os
+import multiprocessing
+import multiprocessing.spawn
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
 from reportlab.platypus import PageBreak
+from soc_engine import (
+    ANOMALY_METHODS, APPROX_DISTINCT_MIN_ROWS, CSV_CHUNK_ROWS, CSV_ENGINES, DISTRIBUTION_RAW_ROWS,
+    ENTITY_MIN_BUCKETS, ENTITY_NAME_HINT, ENTITY_TOP_K, HLL_RELATIVE_ERROR, IOC_FEEDS_DIR,
+    IOC_TYPE_LABELS, PLOT_WEBGL_ROWS, PREPARED_FRAME_VERSION, PROFILE_EXACT_DISTINCT_MAX,
+    RULE_PACKS_DIR, SEASONAL_PERIODS, SEASONAL_WINDOW, SIGNATURE_SHARD_VALUES, SUBNET_PREFIX_V4,
+    SUBNET_PREFIX_V6, THREAT_PATTERNS, WATCH_INTERVAL_SECONDS, WATCH_PATH, WATCH_RETENTION_MINUTES,
+    DatasetView, broadcast_masks, build_entity_index, build_ioc_index, build_rollup,
+    column_ip_values, column_summary, comoment_correlation, concat_ip_values, count_duplicate_rows,
+    cross_file_keep_masks, detect_sensitive_columns, display_frame, distinct_count,
+    distribution_summary, evaluate_rules, file_sha256, ingest_upload, is_text_column,
+    load_cached_dataset, load_cached_profile, load_ioc_dir, load_ioc_feed, load_rule_dir,
+    load_rule_pack, mahalanobis_anomalies, match_iocs, match_unique_values, merge_profiles,
+    minmax_downsample, new_watch_state, numeric_summary, poll_watch, prepare_frame, prepare_upload,
+    profile_frame, profile_moments, rollup_series, row_hashes, ruleset_version, score_anomalies,
+    score_entities, seasonal_scores, signature_counts, signature_mask_dtype, store_cached_dataset,
+    store_cached_profile, strong_correlations, top_network_pairs, top_networks, watch_snapshot
+)
 
 # Set page config with professional SOC theme
 st.set_page_config(
@@ -436,38 +455,359 @@ def init_session_state():
         st.session_state.current_df = None
     if 'file_previews' not in st.session_state:
         st.session_state.file_previews = {}
+    if 'upload_hashes' not in st.session_state:
+        st.session_state.upload_hashes = {}
+    if 'selection_cache' not in st.session_state:
+        st.session_state.selection_cache = {}
+    if 'signature_cache' not in st.session_state:
+        st.session_state.signature_cache = {}
+    if 'ioc_index' not in st.session_state:
+        st.session_state.ioc_index = None
+    if 'watch_state' not in st.session_state:
+        st.session_state.watch_state = None
 
 init_session_state()
 
 # Helper functions
-def clean_column_names(df):
-    """Clean column names by removing special characters and making them lowercase"""
-    df.columns = [re.sub(r'[^a-zA-Z0-9_]', '', col).lower() for col in df.columns]
-    return df
+def worker_count():
+    """Processes in the shared worker pool (SOC_MAX_WORKERS, default one per CPU)"""
+    return int(os.environ.get('SOC_MAX_WORKERS', os.cpu_count() or 1))
+
+def keep_app_out_of_workers():
+    """Stop spawned workers from re-running this script as their __main__
+
+    Streamlit makes this script __main__ while it runs, and spawn start-up data tells
+    each worker to run __main__ again. The workers only need soc_engine, so the script
+    is dropped from that data. The hook is installed once per process and reads
+    nothing per session, so concurrent sessions cannot race on it.
+    """
+    original = multiprocessing.spawn.get_preparation_data
+    if getattr(original, 'keeps_app_out', False):
+        return
+    app_path = os.path.normpath(os.path.abspath(__file__))
+    
+    def preparation_data(name):
+        data = original(name)
+        if data.get('init_main_from_path') == app_path:
+            del data['init_main_from_path']
+        return data
+    
+    preparation_data.keeps_app_out = True
+    multiprocessing.spawn.get_preparation_data = preparation_data
 
-def safe_read_csv(file):
-    """Safely read CSV file with error handling and automatic encoding detection"""
+@st.cache_resource
+def get_process_pool():
+    """Shared worker pool for CPU-heavy work (spawned, since forking a threaded server is unsafe)"""
+    keep_app_out_of_workers()
+    return ProcessPoolExecutor(max_workers=worker_count(), mp_context=multiprocessing.get_context('spawn'))
+
+def reset_process_pool():
+    """Shut down the shared pool (e.g. after a crashed worker broke it) so the next use starts a fresh one"""
+    get_process_pool().shutdown(wait=False, cancel_futures=True)
+    get_process_pool.clear()
+
+def ingest_file(file, file_hash, engine, chunk_rows):
+    """Parse one upload in-process with sidebar progress and an early preview of the first chunk"""
+    progress = st.progress(0.0, text=f"Parsing {file.name}...")
+    preview = st.empty()
+    
+    def on_chunk(chunk, rows, ipv4_columns):
+        if rows == len(chunk):
+            preview.dataframe(display_frame(chunk.head(5), ipv4_columns), use_container_width=True)
+        progress.progress(min(file.tell() / max(file.size, 1), 1.0),
+                          text=f"Parsing {file.name}: {rows:,} rows")
+    
     try:
-        return pd.read_csv(file)
-    except UnicodeDecodeError:
-        return pd.read_csv(file, encoding='latin1')
-    except Exception as e:
-        st.error(f"Error reading file {file.name}: {str(e)}")
-        return None
+        with st.spinner(f"Parsing {file.name}..."):
+            return prepare_upload(file, file.name, file_hash, engine, chunk_rows, on_chunk)
+    finally:
+        progress.empty()
+        preview.empty()
+
+def ingest_files_parallel(jobs, engine, chunk_rows):
+    """Parse several uploads in the process pool, yielding each result as soon as it completes
+
+    Uploads are submitted as workers free up, so only one copy of the raw bytes per
+    worker is held at a time however many files are pending.
+    """
+    status = {}
+    for file, _ in jobs:
+        status[file.name] = st.empty()
+        status[file.name].caption(f"⏳ {file.name}")
+    
+    pool = get_process_pool()
+    pending = iter(jobs)
+    futures = {}
+    
+    def submit_next():
+        job = next(pending, None)
+        if job is not None:
+            file, file_hash = job
+            future = pool.submit(ingest_upload, file.name, file.getvalue(), file_hash, engine, chunk_rows)
+            futures[future] = (file.name, file_hash, pool)
+    
+    for _ in range(worker_count()):
+        submit_next()
+    while futures:
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            name, file_hash, used_pool = futures.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                # A crashed worker (e.g. killed for memory) breaks the pool, so replace it once
+                if used_pool is pool:
+                    reset_process_pool()
+                    pool = get_process_pool()
+                result = {'name': name, 'hash': file_hash, 'data': None, 'meta': {}, 'profile': None,
+                          'row_hashes': None, 'sensitive': [], 'error': str(e), 'seconds': 0.0}
+            
+            if result['error']:
+                status[name].caption(f"❌ {name}")
+            else:
+                status[name].caption(f"✅ {name}: {len(result['data']):,} rows in {result['seconds']:.1f}s")
+            submit_next()
+            yield result
+
+def register_dataset(name, file_hash, df, meta, sensitive_cols, profile=None, hashes=None):
+    """Add a parsed dataset with its column profile and row hashes to the session and flag sensitive columns"""
+    if sensitive_cols:
+        st.warning(f"⚠️ Potential sensitive columns detected in {name}: {', '.join(sensitive_cols)}")
+    
+    st.session_state.uploaded_files.append({
+        'name': name,
+        'hash': file_hash,
+        'data': df,
+        'meta': meta,
+        'profile': profile if profile is not None else profile_frame(df, meta['ipv4_columns']),
+        'row_hashes': hashes if hashes is not None else row_hashes(df, meta['ipv4_columns']),
+        'selected': True,
+        'preview': display_frame(df.head(5), meta['ipv4_columns'])
+    })
+
+def selection_cache(selection_key):
+    """Per-session store for results derived from the selected files, emptied when the selection changes"""
+    cache = st.session_state.selection_cache
+    if cache.get('_key') != selection_key:
+        cache.clear()
+        cache['_key'] = selection_key
+    return cache
+
+def distinct_label(profile, col, approx_distinct_rows):
+    """Distinct-value count of a selected column for display, marked with ~ when estimated"""
+    if col not in profile['columns']:
+        return "N/A"
+    count, approximate = distinct_count(profile['columns'][col], profile['rows'], approx_distinct_rows)
+    return f"~{count:,}" if approximate else f"{count:,}"
+
+def column_moments(df, profile, col):
+    """Mean and standard deviation of a selected numeric column, merged from per-file running statistics"""
+    stats = profile['columns'].get(col, {})
+    if 'mean' not in stats:
+        return df[col].mean(), df[col].std()
+    return profile_moments(stats)
+
+def selection_correlation(df, profile, numeric_cols):
+    """Correlation matrix of the selected numeric columns, merged from per-file co-moments"""
+    if not set(numeric_cols) <= set(profile['comoments']['columns']):
+        return df[numeric_cols].corr()
+    return comoment_correlation(profile['comoments'], numeric_cols)
+
+def selection_anomalies(df, profile, numeric_cols, cache, method, threshold):
+    """Anomaly scores of every numeric column of the selection as (hits, summary), cached per method and threshold"""
+    key = ('anomalies', method, threshold)
+    if key not in cache:
+        moments = {col: column_moments(df, profile, col) for col in numeric_cols} if method == 'zscore' else None
+        cache[key] = score_anomalies(df, numeric_cols, threshold, method, moments)
+    return cache[key]
+
+def scan_signatures(files, columns, patterns):
+    """Cache per-file signature masks of each distinct value of text columns, sharding uncached scans across the worker pool
+
+    Masks are keyed by (dataset hash, column, ruleset version), so they survive selection
+    changes and are rebuilt only when the signatures change. Distinct values follow
+    pd.factorize order; a column only enters the cache once every shard is in.
+    """
+    cache = st.session_state.signature_cache
+    version = ruleset_version(patterns)
+    dtype = signature_mask_dtype(patterns)
+    scanned, shards = {}, []
+    for file_info in files:
+        for col in columns:
+            key = (file_info['hash'], col, version)
+            if key in cache or col not in file_info['data'].columns:
+                continue
+            uniques = np.asarray(pd.factorize(file_info['data'][col])[1], dtype=object)
+            scanned[key] = np.zeros(len(uniques), dtype=dtype)
+            for start in range(0, len(uniques), SIGNATURE_SHARD_VALUES):
+                shards.append((key, start, uniques[start:start + SIGNATURE_SHARD_VALUES]))
+    
+    if len(shards) > 1:
+        pool = get_process_pool()
+        futures = {pool.submit(match_unique_values, values, patterns): (key, start)
+                   for key, start, values in shards}
+        try:
+            for future in as_completed(futures):
+                key, start = futures[future]
+                masks = future.result()
+                scanned[key][start:start + len(masks)] = masks
+        except Exception:
+            reset_process_pool()
+            raise
+    else:
+        for key, start, values in shards:
+            scanned[key][start:start + len(values)] = match_unique_values(values, patterns)
+    cache.update(scanned)
+
+def selection_signature_masks(files, cache, col, patterns=THREAT_PATTERNS):
+    """Per-row signature masks of a column across the selected files, in combined-frame order"""
+    key = ('signatures', col, ruleset_version(patterns))
+    if key not in cache:
+        scan_signatures(files, [col], patterns)
+        version = ruleset_version(patterns)
+        parts = []
+        for file_info, keep in zip(files, cache['keep_masks']):
+            unique_masks = st.session_state.signature_cache.get((file_info['hash'], col, version))
+            if unique_masks is None:
+                masks = np.zeros(len(file_info['data']), dtype=signature_mask_dtype(patterns))
+            else:
+                # Distinct-value masks reach the rows through the column's factor codes
+                masks = broadcast_masks(pd.factorize(file_info['data'][col])[0], unique_masks)
+            parts.append(masks if keep is None else masks[keep])
+        cache[key] = np.concatenate(parts)
+    return cache[key]
+
+def ioc_feed_index(uploads):
+    """IOC index over uploaded feeds and SOC_IOC_DIR as (key, index or None, errors), rebuilt only when the feeds change"""
+    dir_state = ()
+    if IOC_FEEDS_DIR and os.path.isdir(IOC_FEEDS_DIR):
+        dir_state = tuple(sorted((e.name, e.stat().st_mtime, e.stat().st_size) for e in os.scandir(IOC_FEEDS_DIR)))
+    key = (tuple((f.name, f.size) for f in uploads), dir_state)
+    if st.session_state.ioc_index is None or st.session_state.ioc_index[0] != key:
+        feeds, errors = load_ioc_dir(IOC_FEEDS_DIR)
+        for feed_file in uploads:
+            try:
+                feeds.append(load_ioc_feed(feed_file.getvalue(), feed_file.name))
+            except Exception as e:
+                errors.append((feed_file.name, str(e)))
+        st.session_state.ioc_index = (key, build_ioc_index(feeds) if any(len(feed) for feed in feeds) else None, errors)
+    return st.session_state.ioc_index
+
+def selection_ioc_matches(df, cache, ioc_key, ioc_index, ipv4_columns):
+    """IOC matches of the selected data against the loaded feeds, as (indicator table, {column: row positions})"""
+    cache_key = ('iocs', ioc_key)
+    if cache_key not in cache:
+        cache[cache_key] = match_iocs(df, ioc_index, ipv4_columns)
+    return cache[cache_key]
+
+def entity_baselines(df, cache, numeric_cols, ipv4_columns, entity_col, time_col, freq='1h', metric=None,
+                     top_k=ENTITY_TOP_K):
+    """Top entities by deviation from their own baseline; the per-entity bucket index is cached per column and bucket size"""
+    key = ('entity_index', entity_col, time_col, freq)
+    if key not in cache:
+        cache[key] = build_entity_index(df, entity_col, time_col, freq, numeric_cols, entity_col in ipv4_columns)
+    return score_entities(cache[key], metric, top_k)
 
-def validate_dataframe(df):
-    """Basic dataframe validation"""
-    if df is None:
-        return False
-    if df.empty:
-        st.warning("The uploaded file is empty")
-        return False
-    return True
+def time_rollup(df, cache, numeric_cols, time_col):
+    """Minute/hour/day rollup cube of a timestamp column for the selection, split by event type when present"""
+    key = ('rollup', time_col)
+    if key not in cache:
+        cache[key] = build_rollup(df, time_col, numeric_cols, 'event_type' if 'event_type' in df.columns else None)
+    return cache[key]
 
-def detect_sensitive_columns(df):
-    """Identify potentially sensitive columns"""
-    sensitive_keywords = ['password', 'secret', 'key', 'token', 'credit', 'ssn', 'personal']
-    return [col for col in df.columns if any(kw in col.lower() for kw in sensitive_keywords)]
+def selection_ip_values(files, cache, col):
+    """Codes and parsed integers of an IP column across the selected files, in combined-frame order
+
+    Text columns reuse the parse stored in each file's profile at ingest, so only the
+    factor codes are recomputed, once per selection.
+    """
+    key = ('ip_values', col)
+    if key not in cache:
+        parts = []
+        for file_info, keep in zip(files, cache['keep_masks']):
+            data = file_info['data']
+            if col not in data.columns:
+                parts.append((np.full(len(data) if keep is None else int(keep.sum()), -1), None))
+                continue
+            codes, values = column_ip_values(data[col], col in file_info['meta']['ipv4_columns'],
+                                             file_info['profile']['columns'][col].get('ip'))
+            parts.append((codes if keep is None else codes[keep], values))
+        cache[key] = concat_ip_values(parts)
+    return cache[key]
+
+def ip_rollup(files, cache, col, prefix=32, prefix_v6=128):
+    """Top addresses (or networks) of an IP column for the selection, counted on integer ids and cached"""
+    key = ('top_networks', col, prefix, prefix_v6)
+    if key not in cache:
+        codes, values = selection_ip_values(files, cache, col)
+        cache[key] = top_networks(codes, values, prefix, prefix_v6)
+    return cache[key]
+
+def ip_pair_rollup(files, cache, prefix=32, prefix_v6=128):
+    """Top source/destination pairs (or network pairs) for the selection, cached like ip_rollup"""
+    key = ('top_network_pairs', prefix, prefix_v6)
+    if key not in cache:
+        cache[key] = top_network_pairs(selection_ip_values(files, cache, 'source_ip'),
+                                       selection_ip_values(files, cache, 'destination_ip'), prefix, prefix_v6)
+    return cache[key]
+
+def live_monitor(watch_path, watch_interval, watch_retention, anomaly_threshold):
+    """Watch-mode panel: reads what was appended since the last refresh and shows the retained window"""
+    state = st.session_state.watch_state
+    if state is None or state['path'] != watch_path:
+        state = st.session_state.watch_state = new_watch_state(watch_path)
+    new_batches = poll_watch(state, THREAT_PATTERNS, anomaly_threshold, watch_retention * 60)
+    
+    st.markdown("## 📡 Live Monitor")
+    for source, error in state['errors']:
+        st.error(f"Error reading {source}: {error}")
+    if not state['batches']:
+        st.info(f"ℹ️ Waiting for CSV data in {watch_path}")
+        return
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Events in Window", f"{state['rows']:,}",
+                  delta=f"+{sum(len(batch['data']) for batch in new_batches):,}")
+    with col2:
+        st.metric("Signature Hits", f"{sum(state['signature_hits'].values()):,}")
+    with col3:
+        st.metric("Anomalies", f"{sum(state['anomalies'].values()):,}")
+    with col4:
+        st.metric("Files Followed", len(state['cursors']))
+    st.caption(f"Refreshed every {watch_interval}s; rows are kept for {watch_retention:,} minutes after they are read")
+    
+    if not state['timeline'].empty:
+        timeline = state['timeline'].sort_index().rename_axis('Time').reset_index(name='Events')
+        fig = px.line(timeline, x='Time', y='Events', title="Events per Minute")
+        st.plotly_chart(fig, use_container_width=True)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        hits = {name: count for name, count in state['signature_hits'].items() if count > 0}
+        if hits:
+            st.markdown("**Threat Pattern Hits**")
+            st.dataframe(pd.DataFrame.from_dict(hits, orient='index', columns=['Count']), use_container_width=True)
+    with col2:
+        anomalies = {col: count for col, count in state['anomalies'].items() if count > 0}
+        if anomalies:
+            st.markdown(f"**Anomalies (>{anomaly_threshold}σ when read)**")
+            st.dataframe(pd.DataFrame.from_dict(anomalies, orient='index', columns=['Count']), use_container_width=True)
+    
+    recent = [batch for batch in state['batches'][-5:] if not batch['anomaly_rows'].empty]
+    if recent:
+        with st.expander("Latest anomalous events"):
+            for batch in reversed(recent):
+                st.dataframe(display_frame(batch['anomaly_rows'], batch['meta']['ipv4_columns']),
+                             use_container_width=True)
+    
+    # A snapshot of the window can go through the full analysis and report like any upload
+    if st.button("📥 Add window to datasets"):
+        df, meta = watch_snapshot(state)
+        name = f"{meta['source_name']} (live {datetime.datetime.now():%H:%M:%S})"
+        register_dataset(name, f"watch:{watch_path}:{state['rows']}:{state['batches'][-1]['arrived']}", df, meta,
+                         detect_sensitive_columns(df))
+        st.rerun()
 
 # App header
 st.markdown("""
@@ -488,34 +828,70 @@ with st.sidebar:
         help="Upload security logs, alerts, or other SOC-relevant data"
     )
     
+    with st.expander("⚙️ Ingestion Settings"):
+        csv_engine = st.selectbox(
+            "CSV parsing engine",
+            list(CSV_ENGINES.keys()),
+            format_func=lambda x: CSV_ENGINES[x],
+            help="Streaming keeps peak memory bounded; PyArrow parses large files on all CPU cores"
+        )
+        chunk_rows = st.number_input(
+            "Rows per chunk (streaming engine)",
+            min_value=10_000,
+            max_value=5_000_000,
+            value=CSV_CHUNK_ROWS,
+            step=50_000
+        )
+    
     # Process uploaded files
     if uploaded_files:
+        pending = []
         for file in uploaded_files:
             if file.name not in [f['name'] for f in st.session_state.uploaded_files]:
                 try:
-                    if file.name.endswith('.csv'):
-                        df = safe_read_csv(file)
-                    elif file.name.endswith('.xlsx'):
-                        df = pd.read_excel(file)
-                    elif file.name.endswith('.json'):
-                        df = pd.read_json(file)
-                    else:
+                    # Identical bytes (even under another name) are loaded from the dataset cache. Hashes are
+                    # memoised per upload (file_id), so a new export with the same name and size is re-hashed
+                    if file.file_id not in st.session_state.upload_hashes:
+                        st.session_state.upload_hashes[file.file_id] = file_sha256(file)
+                    file_hash = st.session_state.upload_hashes[file.file_id]
+                    known_hashes = [f.get('hash') for f in st.session_state.uploaded_files] + [h for _, h in pending]
+                    if file_hash in known_hashes:
+                        st.info(f"ℹ️ {file.name} is identical to a dataset that is already loaded")
                         continue
                     
-                    if validate_dataframe(df):
-                        df = clean_column_names(df)
-                        sensitive_cols = detect_sensitive_columns(df)
-                        if sensitive_cols:
-                            st.warning(f"⚠️ Potential sensitive columns detected in {file.name}: {', '.join(sensitive_cols)}")
-                        
-                        st.session_state.uploaded_files.append({
-                            'name': file.name,
-                            'data': df,
-                            'selected': True,
-                            'preview': df.head(5)
-                        })
+                    cached = load_cached_dataset(file_hash)
+                    if cached is not None:
+                        df, meta = cached
+                        if meta.get('version') != PREPARED_FRAME_VERSION:
+                            # Entry written by an older release: bring its typing up to date once
+                            df, meta = prepare_frame(df, meta)
+                            meta['source_name'] = file.name
+                            store_cached_dataset(file_hash, df, meta)
+                        # The profile and row hashes are stored with the entry; older entries get them once
+                        derived = load_cached_profile(file_hash, len(df))
+                        if derived is None:
+                            derived = (profile_frame(df, meta['ipv4_columns']), row_hashes(df, meta['ipv4_columns']))
+                            store_cached_profile(file_hash, *derived)
+                        st.caption(f"⚡ {file.name} loaded from dataset cache")
+                        register_dataset(file.name, file_hash, df, meta, detect_sensitive_columns(df), *derived)
+                    else:
+                        pending.append((file, file_hash))
                 except Exception as e:
                     st.error(f"Error processing {file.name}: {str(e)}")
+        
+        # A single file streams in-process with progress; bulk uploads are parsed concurrently
+        results = []
+        if len(pending) == 1:
+            results = [ingest_file(*pending[0], csv_engine, int(chunk_rows))]
+        elif pending:
+            results = ingest_files_parallel(pending, csv_engine, int(chunk_rows))
+        
+        for result in results:
+            if result['error']:
+                st.error(f"Error processing {result['name']}: {result['error']}")
+            else:
+                register_dataset(result['name'], result['hash'], result['data'], result['meta'], result['sensitive'],
+                                 result['profile'], result['row_hashes'])
     
     # File selection and management
     if st.session_state.uploaded_files:
@@ -533,14 +909,33 @@ with st.sidebar:
                 st.text(file_info['name'])
             with cols[2]:
                 if st.button("🗑️", key=f"remove_{i}"):
-                    st.session_state.uploaded_files.pop(i)
+                    removed = st.session_state.uploaded_files.pop(i)
+                    # Scan results of the removed dataset would otherwise stay for the whole session
+                    st.session_state.signature_cache = {
+                        key: masks for key, masks in st.session_state.signature_cache.items()
+                        if key[0] != removed['hash']
+                    }
                     st.rerun()
         
         if st.button("Clear All Datasets", type="primary"):
             st.session_state.uploaded_files = []
             st.session_state.current_df = None
+            st.session_state.selection_cache = {}
+            st.session_state.signature_cache = {}
             st.rerun()
     
+    st.markdown("---")
+    st.markdown("### 📡 Watch Mode")
+    watch_path = st.text_input(
+        "Watch file or directory",
+        value=WATCH_PATH,
+        help="Follow a growing CSV export (or every CSV in a directory), reading only appended lines"
+    )
+    watch_enabled = st.toggle("Watch for new data", value=False, disabled=not watch_path)
+    with st.expander("⚙️ Watch Settings"):
+        watch_interval = st.number_input("Refresh every (seconds)", min_value=5, value=WATCH_INTERVAL_SECONDS, step=5)
+        watch_retention = st.number_input("Keep rows for (minutes)", min_value=1, value=WATCH_RETENTION_MINUTES, step=60)
+    
     st.markdown("---")
     st.markdown("### ⚙️ Analysis Settings")
     
@@ -560,6 +955,64 @@ with st.sidebar:
         step=0.5,
         help="Standard deviations from mean to consider as anomaly"
     )
+    anomaly_method = st.selectbox(
+        "Anomaly scoring",
+        list(ANOMALY_METHODS.keys()),
+        format_func=lambda x: ANOMALY_METHODS[x],
+        help="The robust option scores against the median and MAD, which a burst of outliers cannot skew"
+    )
+    
+    # Distinct counts switch to mergeable HyperLogLog sketches on large selections and high-cardinality columns
+    approx_distinct_rows = st.number_input(
+        "Estimate all distinct counts above (rows)",
+        min_value=0,
+        value=APPROX_DISTINCT_MIN_ROWS,
+        step=100_000,
+        help=f"Larger selections report HyperLogLog estimates (±{HLL_RELATIVE_ERROR:.1%} standard error) for every "
+             f"column. Columns with more than {PROFILE_EXACT_DISTINCT_MAX:,} distinct values in a file are always "
+             f"estimated; estimates are marked with ~"
+    )
+    
+    drop_cross_file_duplicates = st.checkbox(
+        "Drop rows duplicated across files",
+        value=False,
+        help="Overlapping exports often repeat rows; keep only the first copy when combining datasets"
+    )
+    
+    st.markdown("---")
+    st.markdown("### 🧩 Signature Rule Packs")
+    rule_pack_files = st.file_uploader(
+        "Load YAML/JSON rule packs",
+        type=["yml", "yaml", "json"],
+        accept_multiple_files=True,
+        help="Sigma-like rules with keywords, regexes and field conditions"
+    )
+    
+    # Packs from SOC_RULES_DIR are always loaded; uploaded packs are added on top
+    rules, rule_errors = load_rule_dir(RULE_PACKS_DIR)
+    for pack in rule_pack_files or []:
+        try:
+            rules.extend(load_rule_pack(pack.getvalue().decode('utf-8'), pack.name))
+        except Exception as e:
+            rule_errors.append((pack.name, str(e)))
+    for pack_name, error in rule_errors:
+        st.error(f"Error loading rule pack {pack_name}: {error}")
+    if rules:
+        st.caption(f"{len(rules)} rules loaded")
+    
+    st.markdown("---")
+    st.markdown("### 🛰️ Threat Intelligence Feeds")
+    ioc_feed_files = st.file_uploader(
+        "Load IOC feeds",
+        type=["csv", "txt", "json"],
+        accept_multiple_files=True,
+        help="IPs, CIDRs, domains, URLs and file hashes as CSV/TXT lists or STIX-lite JSON"
+    )
+    ioc_key, ioc_index, ioc_errors = ioc_feed_index(ioc_feed_files or [])
+    for feed_name, error in ioc_errors:
+        st.error(f"Error loading IOC feed {feed_name}: {error}")
+    if ioc_index is not None:
+        st.caption(f"{ioc_index['size']:,} indicators from {len(ioc_index['sources'])} feeds")
     
     st.markdown("---")
     st.markdown("### 🔒 Security Features")
@@ -576,6 +1029,12 @@ with st.sidebar:
     """, unsafe_allow_html=True)
 
 # Main content area
+if watch_enabled:
+    st.fragment(live_monitor, run_every=int(watch_interval))(
+        watch_path, int(watch_interval), int(watch_retention), anomaly_threshold
+    )
+    st.markdown("---")
+
 if not st.session_state.uploaded_files:
     # Welcome screen when no data is loaded
     st.info("ℹ️ Upload security data files to begin analysis. Supported formats: CSV, Excel, JSON")
@@ -648,18 +1107,42 @@ else:
         st.warning("No files selected. Please select at least one file for analysis.")
         st.stop()
     
-    # Combine selected dataframes
+    # Combine selected dataframes (only rebuilt when the selection or duplicate handling changes)
+    analysis_cache = selection_cache((tuple(f['hash'] for f in selected_files), drop_cross_file_duplicates))
+    if 'view' not in analysis_cache:
+        frames = [f['data'] for f in selected_files]
+        hashes = [f['row_hashes'] for f in selected_files]
+        profiles = [f['profile'] for f in selected_files]
+        analysis_cache['keep_masks'] = [None] * len(selected_files)
+        if drop_cross_file_duplicates and len(selected_files) > 1:
+            keep_masks = cross_file_keep_masks(hashes)
+            for i, (file_info, keep) in enumerate(zip(selected_files, keep_masks)):
+                if not keep.all():
+                    frames[i] = file_info['data'][keep]
+                    hashes[i] = hashes[i][keep]
+                    profiles[i] = profile_frame(frames[i], file_info['meta']['ipv4_columns'])
+                    analysis_cache['keep_masks'][i] = keep
+            analysis_cache['dropped_rows'] = int(sum((~keep).sum() for keep in keep_masks))
+        analysis_cache['view'] = DatasetView(frames, [f['meta']['ipv4_columns'] for f in selected_files])
+        analysis_cache['profile'] = merge_profiles(profiles)
+        analysis_cache['duplicate_rows'] = count_duplicate_rows(hashes)
+    dataset_view = analysis_cache['view']
+    profile = analysis_cache['profile']
+    ipv4_columns = selected_files[0]['meta']['ipv4_columns']
     try:
-        dfs = [f['data'] for f in selected_files]
-        if len(dfs) > 1:
-            combined_df = pd.concat(dfs, ignore_index=True)
-            st.session_state.current_df = combined_df
-            st.success(f"✅ Successfully combined {len(dfs)} datasets with {len(combined_df):,} total records")
-        else:
-            st.session_state.current_df = dfs[0]
+        if 'combined' not in analysis_cache:
+            analysis_cache['combined'] = dataset_view.materialize()
+        combined_df, ipv4_columns = analysis_cache['combined']
+        st.session_state.current_df = combined_df
+        if len(selected_files) > 1:
+            st.success(f"✅ Successfully combined {len(selected_files)} datasets with {len(combined_df):,} total records")
+        if analysis_cache.get('dropped_rows'):
+            st.info(f"ℹ️ Dropped {analysis_cache['dropped_rows']:,} rows already present in an earlier selected file")
     except Exception as e:
         st.error(f"Error combining datasets: {str(e)}")
-        st.session_state.current_df = dfs[0]
+        ipv4_columns = selected_files[0]['meta']['ipv4_columns']
+        profile = selected_files[0]['profile']
+        st.session_state.current_df = selected_files[0]['data']
     
     df = st.session_state.current_df
     
@@ -670,7 +1153,7 @@ else:
         # Dataset overview
         st.markdown("### Dataset Overview")
         
-        col1, col2, col3, col4 = st.columns(4)
+        col1, col2, col3, col4, col5 = st.columns(5)
         
         with col1:
             st.metric("Total Records", f"{len(df):,}")
@@ -679,34 +1162,41 @@ else:
             st.metric("Total Columns", len(df.columns))
         
         with col3:
-            missing_values = df.isnull().sum().sum()
+            missing_values = sum(stats['nulls'] for stats in profile['columns'].values())
             st.metric("Missing Values", f"{missing_values:,}")
         
         with col4:
-            duplicate_rows = df.duplicated().sum()
-            st.metric("Duplicate Rows", f"{duplicate_rows:,}")
+            st.metric("Duplicate Rows", f"{analysis_cache['duplicate_rows']:,}")
+        
+        with col5:
+            # Savings from the ingest-time compaction pass (categoricals, packed IPs, downcasting)
+            memory_before = sum(f['meta']['memory_before'] for f in selected_files)
+            memory_after = sum(f['meta']['memory_after'] for f in selected_files)
+            st.metric(
+                "Memory Footprint",
+                f"{memory_after / (1024*1024):.1f} MB",
+                delta=f"-{(1 - memory_after / max(memory_before, 1)) * 100:.0f}% vs {memory_before / (1024*1024):.1f} MB raw",
+                delta_color="inverse"
+            )
         
         # Data preview
         with st.expander("🔍 Data Preview", expanded=True):
-            st.dataframe(df.head(10), use_container_width=True)
+            st.dataframe(display_frame(df.head(10), ipv4_columns), use_container_width=True)
         
         # Column information
         with st.expander("📋 Column Details"):
-            col_info = pd.DataFrame({
-                'Column': df.columns,
-                'Type': df.dtypes.values,
-                'Unique Values': [df[col].nunique() for col in df.columns],
-                'Missing Values': df.isnull().sum().values,
-                '% Missing': (df.isnull().sum().values / len(df) * 100)
-            })
+            # Merged from the per-file profiles rather than rescanning the combined frame
+            col_info = column_summary(profile, df.dtypes, approx_distinct_rows)
             st.dataframe(col_info.style.format({'% Missing': '{:.1f}%'}), use_container_width=True)
+            if col_info['Unique Values'].str.startswith('~').any():
+                st.caption(f"Unique values marked ~ are HyperLogLog estimates (±{HLL_RELATIVE_ERROR:.1%} standard error)")
         
         # Basic statistics
-        numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
+        numeric_cols = [col for col in df.select_dtypes(include=['number']).columns if col not in ipv4_columns]
         if numeric_cols:
             with st.expander("🧮 Numeric Statistics"):
                 st.dataframe(
-                    df[numeric_cols].describe().T.style \
+                    numeric_summary(profile, numeric_cols).style \
                         .background_gradient(cmap='Blues', subset=['mean', '50%']) \
                         .background_gradient(cmap='Reds', subset=['std', 'max']),
                     use_container_width=True
@@ -722,12 +1212,17 @@ else:
             with st.expander("⏳ Time-Based Analysis", expanded=True):
                 selected_time_col = st.selectbox("Select timestamp column", datetime_cols)
                 
-                # Convert to datetime if not already
-                df[selected_time_col] = pd.to_datetime(df[selected_time_col])
+                # Timestamps were typed once at ingest; show the format each file was parsed with
+                parsed_formats = sorted({
+                    f['meta']['timestamp_formats'][selected_time_col] for f in selected_files
+                    if selected_time_col in f['meta']['timestamp_formats']
+                })
+                if parsed_formats:
+                    st.caption(f"Parsed at ingest with format: {', '.join(parsed_formats)}")
                 
                 # Resample frequency
                 freq = st.selectbox("Aggregation frequency", 
-                                  ['Raw', '1Min', '5Min', '15Min', '1H', '6H', '1D', '1W'], 
+                                  ['Raw', '1Min', '5Min', '15Min', '1h', '6h', '1D', '1W'], 
                                   index=3)
                 
                 if freq != 'Raw':
@@ -735,46 +1230,93 @@ else:
                     value_options = ['Event Count'] + numeric_cols
                     selected_value = st.selectbox("Select value to plot", value_options)
                     
+                    # Served from the selection's rollup cube rather than re-resampling the rows
+                    rollup = time_rollup(df, analysis_cache, numeric_cols, selected_time_col)
                     if selected_value == 'Event Count':
-                        time_series = df.set_index(selected_time_col).resample(freq).size()
+                        time_series = rollup_series(rollup, freq)['count']
                         title = f"Event Frequency ({freq})"
                     else:
-                        time_series = df.set_index(selected_time_col).resample(freq)[selected_value].mean()
+                        time_series = rollup_series(rollup, freq, [selected_value])[selected_value]
                         title = f"Mean {selected_value} ({freq})"
+                    time_series = time_series.rename_axis(selected_time_col)
                     
                     fig = px.line(time_series.reset_index(), 
-                                 x=selected_time_col, y=0 if selected_value == 'Event Count' else selected_value,
+                                 x=selected_time_col, y=time_series.name,
                                  title=title)
+                    
+                    # Daily and weekly cycles are part of each hour's baseline instead of tripping a global threshold
+                    seasonal = None
+                    if st.checkbox("Flag seasonal anomalies",
+                                   help="Score each bucket against the rolling median and MAD of the same hour in recent weeks or days"):
+                        col1, col2 = st.columns(2)
+                        with col1:
+                            seasonal_period = st.selectbox("Seasonal baseline", list(SEASONAL_PERIODS.keys()),
+                                                           format_func=lambda x: SEASONAL_PERIODS[x])
+                        with col2:
+                            seasonal_window = st.number_input("Baseline window (weeks or days)", min_value=1, max_value=52,
+                                                              value=SEASONAL_WINDOW)
+                        try:
+                            seasonal = seasonal_scores(time_series, seasonal_period, int(seasonal_window))
+                        except ValueError as e:
+                            st.info(f"ℹ️ {e}")
+                    
+                    if seasonal is not None:
+                        flagged = seasonal[seasonal['score'].abs() > anomaly_threshold]
+                        fig.add_trace(go.Scatter(
+                            x=flagged.index,
+                            y=flagged['value'],
+                            mode='markers',
+                            name='Seasonal anomaly',
+                            marker=dict(color='red', size=8, line=dict(width=1, color='DarkSlateGrey'))
+                        ))
                     st.plotly_chart(fig, use_container_width=True)
+                    
+                    if seasonal is not None:
+                        st.metric("Seasonal Anomalies", len(flagged))
+                        if len(flagged) > 0:
+                            st.dataframe(
+                                flagged.reindex(flagged['score'].abs().sort_values(ascending=False).index).head(10),
+                                use_container_width=True
+                            )
                 
                 # Time-based aggregations
                 st.markdown("**Time-Based Aggregations**")
-                time_agg = df.set_index(selected_time_col).resample(freq if freq != 'Raw' else '1H').agg({
-                    'count': 'size',
-                    **{col: 'mean' for col in numeric_cols}
-                }).reset_index()
+                time_agg = rollup_series(time_rollup(df, analysis_cache, numeric_cols, selected_time_col),
+                                         freq if freq != 'Raw' else '1h', numeric_cols)
+                time_agg = time_agg.rename_axis(selected_time_col).reset_index()
                 st.dataframe(time_agg.head(10), use_container_width=True)
         
         # Threat pattern detection (simplified)
         with st.expander("🛡️ Threat Pattern Detection"):
-            text_cols = df.select_dtypes(include=['object']).columns.tolist()
+            text_cols = [col for col in df.columns if is_text_column(df[col])]
             
             if text_cols:
+                if st.checkbox("Scan all text columns", value=False,
+                               help="Scans every text column in parallel; results are cached per dataset, column and signature set"):
+                    with st.spinner(f"Scanning {len(text_cols)} text columns..."):
+                        scan_signatures(selected_files, text_cols, THREAT_PATTERNS)
+                        column_hits = pd.DataFrame({
+                            col: signature_counts(selection_signature_masks(selected_files, analysis_cache, col),
+                                                  list(THREAT_PATTERNS))
+                            for col in text_cols
+                        }).T
+                    column_hits = column_hits[column_hits.sum(axis=1) > 0]
+                    if not column_hits.empty:
+                        st.warning(f"Threat patterns found in {len(column_hits)} of {len(text_cols)} text columns:")
+                        st.dataframe(column_hits.style.background_gradient(cmap='Reds'), use_container_width=True)
+                    else:
+                        st.info("No common threat patterns detected in any text column")
+                
                 selected_text_col = st.selectbox("Select text column for pattern detection", text_cols)
                 
-                # Simple pattern matching (in real app, use proper threat intelligence)
-                patterns = {
-                    'SQL Injection': r'(\bunion\b.*\bselect\b|\bselect\b.*\bfrom\b|\binsert\b.*\binto\b)',
-                    'XSS': r'(\bscript\b|\balert\b|\bonerror\b|\bonload\b)',
-                    'RCE': r'(\bsystem\b|\bexec\b|\beval\b|\bcmd\b)',
-                    'LFI/RFI': r'(\.\./|\.\\|\\\.\.|\binclude\b|\brequire\b)'
-                }
+                # One scan of the column yields a per-row signature bitmask that drives counts and samples
+                signature_masks = selection_signature_masks(selected_files, analysis_cache, selected_text_col)
+                pattern_bits = {name: np.uint64(1 << bit) for bit, name in enumerate(THREAT_PATTERNS)}
                 
-                detected_patterns = {}
-                for pattern_name, pattern in patterns.items():
-                    matches = df[selected_text_col].str.contains(pattern, case=False, regex=True).sum()
-                    if matches > 0:
-                        detected_patterns[pattern_name] = matches
+                detected_patterns = {
+                    name: count for name, count in signature_counts(signature_masks, list(THREAT_PATTERNS)).items()
+                    if count > 0
+                }
                 
                 if detected_patterns:
                     st.warning("Potential threat patterns detected:")
@@ -783,26 +1325,117 @@ else:
                     
                     # Show sample of matches
                     for pattern_name in detected_patterns.keys():
-                        matches = df[df[selected_text_col].str.contains(patterns[pattern_name], case=False, regex=True)]
+                        matches = df[(signature_masks & pattern_bits[pattern_name]) != 0]
                         with st.expander(f"Sample {pattern_name} matches"):
-                            st.dataframe(matches.head(5), use_container_width=True)
+                            st.dataframe(display_frame(matches.head(5), ipv4_columns), use_container_width=True)
                 else:
                     st.info("No common threat patterns detected in this column")
             else:
                 st.warning("No text columns available for pattern detection")
         
+        # Loaded rule packs, compiled into one shared scan per field
+        with st.expander("🧩 Rule Pack Detection"):
+            if rules:
+                rules_key = ('rules', ruleset_version(rules))
+                if rules_key not in analysis_cache:
+                    analysis_cache[rules_key] = evaluate_rules(df, rules, ipv4_columns)
+                rule_hits, rule_summary = analysis_cache[rules_key]
+                
+                st.caption(f"{len(rules)} rules evaluated in {rule_summary['Time (ms)'].sum():.0f} ms")
+                st.dataframe(
+                    rule_summary.sort_values('Matches', ascending=False).style
+                        .format({'Time (ms)': '{:.1f}'})
+                        .background_gradient(cmap='Reds', subset=['Matches']),
+                    use_container_width=True
+                )
+                
+                matched_rules = rule_summary.loc[rule_summary['Matches'] > 0, 'Rule'].tolist()
+                if matched_rules:
+                    selected_rule = st.selectbox("Show sample matches for rule", matched_rules)
+                    st.dataframe(display_frame(df.iloc[rule_hits[selected_rule][:10]], ipv4_columns),
+                                 use_container_width=True)
+            else:
+                st.info("Load YAML/JSON rule packs from the sidebar (or set SOC_RULES_DIR) to run them here")
+        
+        # Top talkers rolled up to networks on integer addresses
+        ip_cols = [col for col in ['source_ip', 'destination_ip'] if col in df.columns]
+        if ip_cols:
+            with st.expander("🌐 Source/Destination Analysis"):
+                col1, col2 = st.columns(2)
+                with col1:
+                    subnet_prefix = st.slider("IPv4 prefix length", min_value=8, max_value=32, value=SUBNET_PREFIX_V4,
+                                              help="32 shows individual hosts; 24 rolls addresses up to /24 networks")
+                with col2:
+                    subnet_prefix_v6 = st.slider("IPv6 prefix length", min_value=16, max_value=128, value=SUBNET_PREFIX_V6,
+                                                 step=8)
+                
+                rollup_cols = st.columns(len(ip_cols))
+                for rollup_col, col in zip(rollup_cols, ip_cols):
+                    with rollup_col:
+                        st.markdown(f"**Top {'Source' if col == 'source_ip' else 'Destination'} Networks**")
+                        st.dataframe(ip_rollup(selected_files, analysis_cache, col, subnet_prefix, subnet_prefix_v6),
+                                     use_container_width=True)
+                
+                if len(ip_cols) == 2:
+                    st.markdown("**Top Communication Pairs**")
+                    st.dataframe(ip_pair_rollup(selected_files, analysis_cache, subnet_prefix, subnet_prefix_v6),
+                                 use_container_width=True)
+        
+        # Hosts and users compared with their own history rather than the global distribution
+        entity_cols = [col for col in df.columns if ENTITY_NAME_HINT.search(col)]
+        if entity_cols and datetime_cols:
+            with st.expander("👤 Entity Baselines"):
+                col1, col2 = st.columns(2)
+                with col1:
+                    entity_col = st.selectbox("Entity column", entity_cols)
+                    entity_metric = st.selectbox("Measure", ['Event Count'] + numeric_cols,
+                                                 format_func=lambda x: x if x == 'Event Count' else f"Sum of {x}")
+                with col2:
+                    entity_time_col = st.selectbox("Timestamp column", datetime_cols, key='entity_time')
+                    entity_freq = st.selectbox("Baseline bucket", ['1h', '1D'], key='entity_freq')
+                entity_top_k = st.slider("Entities to show", min_value=5, max_value=50, value=ENTITY_TOP_K)
+                
+                top_entities = entity_baselines(df, analysis_cache, numeric_cols, ipv4_columns,
+                                                entity_col, entity_time_col, entity_freq,
+                                                None if entity_metric == 'Event Count' else entity_metric, entity_top_k)
+                if not top_entities.empty:
+                    st.caption(f"Each entity's busiest {entity_freq} bucket against its mean over the other buckets since it was first seen")
+                    st.dataframe(
+                        top_entities.style.format({'Baseline': '{:.2f}', 'Peak': '{:.2f}', 'Ratio': '{:.1f}x', 'Score': '{:.1f}'})
+                            .background_gradient(cmap='Reds', subset=['Score']),
+                        use_container_width=True
+                    )
+                else:
+                    st.info(f"No entity has been seen for at least {ENTITY_MIN_BUCKETS} buckets yet")
+        
+        # Known-bad indicators from local threat-intelligence feeds
+        with st.expander("🛰️ Threat Intelligence Matches"):
+            if ioc_index is not None:
+                ioc_matches, ioc_rows = selection_ioc_matches(df, analysis_cache, ioc_key, ioc_index, ipv4_columns)
+                if not ioc_matches.empty:
+                    st.error(f"🚨 {len(ioc_matches):,} indicators matched {ioc_matches['Events'].sum():,} events")
+                    st.dataframe(ioc_matches.head(100), use_container_width=True)
+                    ioc_column = st.selectbox("Show matching events in column", list(ioc_rows))
+                    st.dataframe(display_frame(df.iloc[ioc_rows[ioc_column][:10]], ipv4_columns),
+                                 use_container_width=True)
+                else:
+                    st.success(f"No events matched the {ioc_index['size']:,} loaded indicators")
+            else:
+                st.info("Load IOC feeds from the sidebar (or set SOC_IOC_DIR) to match them against the data")
+        
         # Anomaly detection
         if numeric_cols:
             with st.expander("🚨 Anomaly Detection"):
-                selected_anomaly_col = st.selectbox("Select column for anomaly detection", numeric_cols)
+                # All numeric columns are scored at once; the result is cached apart from the shared frame
+                anomaly_hits, anomaly_summary = selection_anomalies(df, profile, numeric_cols, analysis_cache,
+                                                                    anomaly_method, anomaly_threshold)
+                st.dataframe(anomaly_summary.set_index('Column'), use_container_width=True)
                 
-                # Z-score based anomaly detection
-                mean = df[selected_anomaly_col].mean()
-                std = df[selected_anomaly_col].std()
+                selected_anomaly_col = st.selectbox("Select column for anomaly detection", numeric_cols)
                 
-                if std > 0:  # Avoid division by zero
-                    df['z_score'] = (df[selected_anomaly_col] - mean) / std
-                    anomalies = df[abs(df['z_score']) > anomaly_threshold]
+                if anomaly_summary.set_index('Column').at[selected_anomaly_col, 'Scale'] > 0:  # Avoid division by zero
+                    z_scores = anomaly_hits[selected_anomaly_col]
+                    anomalies = df.iloc[z_scores.index].assign(z_score=z_scores.to_numpy())
                     
                     col1, col2 = st.columns(2)
                     with col1:
@@ -812,19 +1445,23 @@ else:
                     
                     if len(anomalies) > 0:
                         st.dataframe(
-                            anomalies.sort_values('z_score', ascending=False).head(10), 
+                            display_frame(anomalies.sort_values('z_score', ascending=False).head(10), ipv4_columns), 
                             use_container_width=True
                         )
                         
+                        # Long columns are reduced to per-bucket extremes and drawn with WebGL; anomalies are all kept
+                        values = df[selected_anomaly_col].to_numpy(dtype=np.float64, na_value=np.nan)
+                        shown = minmax_downsample(values)
+                        scatter = go.Scattergl if len(df) > PLOT_WEBGL_ROWS else go.Scatter
                         fig = go.Figure()
-                        fig.add_trace(go.Scatter(
-                            x=df.index,
-                            y=df[selected_anomaly_col],
+                        fig.add_trace(scatter(
+                            x=df.index[shown],
+                            y=values[shown],
                             mode='markers',
-                            name='Normal',
+                            name='Normal' if len(shown) == len(values) else 'Normal (min/max per bucket)',
                             marker=dict(color='blue', opacity=0.6)
                         ))
-                        fig.add_trace(go.Scatter(
+                        fig.add_trace(scatter(
                             x=anomalies.index,
                             y=anomalies[selected_anomaly_col],
                             mode='markers',
@@ -841,7 +1478,36 @@ else:
                     else:
                         st.info("No anomalies detected with current threshold")
                 else:
-                    st.warning("Standard deviation is zero - cannot detect anomalies")
+                    st.warning("The column's spread is zero - cannot detect anomalies")
+                
+                # Events that are unusual only in combination, e.g. many bytes over a short duration
+                if len(numeric_cols) > 1:
+                    st.markdown("**Multivariate Anomalies**")
+                    if st.checkbox("Score combinations of all numeric columns (Mahalanobis distance)",
+                                   help="Fitted on a row sample with a shrunk covariance, then scored in chunks"):
+                        key = ('multivariate', tuple(numeric_cols), anomaly_threshold)
+                        if key not in analysis_cache:
+                            with st.spinner(f"Scoring {len(df):,} rows across {len(numeric_cols)} columns..."):
+                                analysis_cache[key] = mahalanobis_anomalies(df, numeric_cols, anomaly_threshold)
+                        multivariate_hits, multivariate_model = analysis_cache[key]
+                        
+                        col1, col2, col3 = st.columns(3)
+                        with col1:
+                            st.metric("Multivariate Anomalies", f"{len(multivariate_hits):,}")
+                        with col2:
+                            st.metric("Distance Cutoff", f"{multivariate_model['cutoff']:.2f}")
+                        with col3:
+                            st.metric("Covariance Shrinkage", f"{multivariate_model['shrinkage']:.2f}")
+                        
+                        if len(multivariate_hits) > 0:
+                            top_hits = multivariate_hits.head(10)
+                            st.dataframe(
+                                display_frame(df.iloc[top_hits.index], ipv4_columns).assign(
+                                    distance=top_hits['distance'].to_numpy(),
+                                    main_driver=top_hits['main_driver'].to_numpy()
+                                ),
+                                use_container_width=True
+                            )
     
     with tab3:
         # Visualizations
@@ -852,17 +1518,17 @@ else:
             with st.expander("🌋 Threat Heatmap"):
                 selected_time_col = st.selectbox("Select time column for heatmap", datetime_cols, key='heatmap_time')
                 
-                # Create heatmap data
-                heatmap_data = df.copy()
-                heatmap_data[selected_time_col] = pd.to_datetime(heatmap_data[selected_time_col])
-                heatmap_data['hour'] = heatmap_data[selected_time_col].dt.hour
-                heatmap_data['day'] = heatmap_data[selected_time_col].dt.day_name()
+                # Hourly event counts from the rollup cube (rows without an event type are left out)
+                hourly = time_rollup(df, analysis_cache, numeric_cols, selected_time_col)['h']
+                hourly = hourly[hourly['split'].notna()]
                 
                 # Pivot for heatmap
                 day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-                heatmap_pivot = heatmap_data.groupby(['day', 'hour'])['event_type'].count().reset_index()
+                heatmap_pivot = hourly['count'].rename('event_type').groupby(
+                    [hourly['time'].dt.day_name().rename('day'), hourly['time'].dt.hour.rename('hour')]
+                ).sum().reset_index()
                 heatmap_pivot['day'] = pd.Categorical(heatmap_pivot['day'], categories=day_order, ordered=True)
-                heatmap_pivot = heatmap_pivot.pivot('day', 'hour', 'event_type')
+                heatmap_pivot = heatmap_pivot.pivot(index='day', columns='hour', values='event_type')
                 
                 # Create heatmap
                 fig, ax = plt.subplots(figsize=(12, 6))
@@ -879,7 +1545,45 @@ else:
                     selected_col = st.selectbox("Select column for distribution", numeric_cols, key='dist_col')
                     plot_type = st.radio("Select plot type", ["Histogram", "Box Plot", "Violin Plot", "ECDF"])
                     
-                    if plot_type == "Histogram":
+                    # Large columns are summarised server-side so the chart payload does not grow with the data
+                    summary = None
+                    if len(df) > DISTRIBUTION_RAW_ROWS:
+                        key = ('distribution', selected_col)
+                        if key not in analysis_cache:
+                            analysis_cache[key] = distribution_summary(df[selected_col])
+                        summary = analysis_cache[key]
+                    
+                    if summary is not None:
+                        st.caption(f"Summarised from {summary['rows']:,} values")
+                        fig = go.Figure()
+                        if plot_type == "Histogram":
+                            fig.add_trace(go.Bar(x=(summary['edges'][:-1] + summary['edges'][1:]) / 2, y=summary['counts'],
+                                                 width=np.diff(summary['edges']), marker_color='#1a3e72', name=selected_col))
+                            fig.update_layout(title=f"Distribution of {selected_col}", bargap=0,
+                                              xaxis_title=selected_col, yaxis_title="count")
+                        elif plot_type == "Box Plot":
+                            fig.add_trace(go.Box(
+                                name=selected_col, q1=[summary['q1']], median=[summary['median']], q3=[summary['q3']],
+                                lowerfence=[summary['lowerfence']], upperfence=[summary['upperfence']],
+                                mean=[summary['mean']], sd=[summary['std']], marker_color='#1a3e72'
+                            ))
+                            fig.add_trace(go.Scatter(x=[selected_col] * len(summary['outliers']), y=summary['outliers'],
+                                                     mode='markers', name='Most extreme outliers',
+                                                     marker=dict(color='#1a3e72', size=4)))
+                            fig.update_layout(title=f"Box Plot of {selected_col}")
+                        elif plot_type == "Violin Plot":
+                            width = summary['density'] / summary['density'].max() * 0.4
+                            fig.add_trace(go.Scatter(x=np.r_[width, -width[::-1]], y=np.r_[summary['grid'], summary['grid'][::-1]],
+                                                     fill='toself', mode='lines', line_color='#1a3e72', name=selected_col))
+                            fig.add_trace(go.Scatter(x=[0], y=[summary['median']], mode='markers', name='Median',
+                                                     marker=dict(color='white', size=8, line=dict(width=1, color='#1a3e72'))))
+                            fig.update_layout(title=f"Violin Plot of {selected_col}", yaxis_title=selected_col,
+                                              xaxis=dict(showticklabels=False))
+                        else:  # ECDF
+                            fig.add_trace(go.Scatter(x=summary['ecdf_x'], y=summary['ecdf_y'], mode='lines', line_shape='hv',
+                                                     name=selected_col))
+                            fig.update_layout(title=f"ECDF of {selected_col}", xaxis_title=selected_col, yaxis_title="probability")
+                    elif plot_type == "Histogram":
                         fig = px.histogram(df, x=selected_col, marginal="rug", 
                                           title=f"Distribution of {selected_col}",
                                           color_discrete_sequence=['#1a3e72'])
@@ -908,7 +1612,9 @@ else:
                                        title=f"{y_col} vs {x_col}",
                                        color_discrete_sequence=['#1a3e72'])
                     else:
-                        fig = px.scatter(df, x=x_col, y=y_col, color=color_col,
+                        # Packed IPv4 columns colour by address, not by a gradient over their integers
+                        plot_df = display_frame(df[list(dict.fromkeys([x_col, y_col, color_col]))], ipv4_columns)
+                        fig = px.scatter(plot_df, x=x_col, y=y_col, color=color_col,
                                        title=f"{y_col} vs {x_col} by {color_col}")
                     
                     st.plotly_chart(fig, use_container_width=True)
@@ -918,7 +1624,7 @@ else:
         # Correlation analysis
         if len(numeric_cols) > 1:
             with st.expander("🔄 Correlation Matrix"):
-                corr_matrix = df[numeric_cols].corr()
+                corr_matrix = selection_correlation(df, profile, numeric_cols)
                 
                 # Create custom diverging colormap
                 cmap = LinearSegmentedColormap.from_list(
@@ -1119,12 +1825,13 @@ else:
                     
                     # Actual data-driven summary
                     total_events = len(df)
-                    unique_src_ips = df['source_ip'].nunique() if 'source_ip' in df.columns else "N/A"
-                    unique_dst_ips = df['destination_ip'].nunique() if 'destination_ip' in df.columns else "N/A"
+                    unique_src_ips = distinct_label(profile, 'source_ip', approx_distinct_rows)
+                    unique_dst_ips = distinct_label(profile, 'destination_ip', approx_distinct_rows)
                     
-                    # Threat stats (if event_type exists)
+                    # Threat stats (if event_type exists), counted file by file without the merged copy
                     if 'event_type' in df.columns:
-                        top_threats = df['event_type'].value_counts().nlargest(3)
+                        event_counts = dataset_view.value_counts('event_type')
+                        top_threats = event_counts.nlargest(3)
                         threat_summary = " ".join([f"{count} {threat} events;" 
                                                  for threat, count in top_threats.items()])
                     else:
@@ -1155,26 +1862,32 @@ else:
                     
                     # 1. Top threats finding
                     if 'event_type' in df.columns:
-                        top_threat = df['event_type'].value_counts().idxmax()
+                        top_threat = event_counts.idxmax()
                         findings.append(f"• The most common threat type was {top_threat}, representing "
-                                      f"{df['event_type'].value_counts(normalize=True).iloc[0]:.1%} of all events")
+                                      f"{event_counts.iloc[0] / event_counts.sum():.1%} of all events")
                     
                     # 2. Time pattern finding
                     if datetime_cols:
                         time_col = datetime_cols[0]
-                        hourly_events = df.set_index(time_col).resample('H').size()
+                        hourly_events = rollup_series(time_rollup(df, analysis_cache, numeric_cols, time_col), 'h')['count']
                         peak_hour = hourly_events.idxmax().strftime('%H:%M')
                         findings.append(f"• Event activity peaked at {peak_hour} with {hourly_events.max()} events per hour")
                     
                     # 3. Source IP finding
-                    if 'source_ip' in df.columns:
-                        top_source = df['source_ip'].value_counts().idxmax()
-                        findings.append(f"• The most active source IP was {top_source} with "
-                                      f"{df['source_ip'].value_counts().max()} events")
+                    top_sources = ip_rollup(selected_files, analysis_cache, 'source_ip') if 'source_ip' in df.columns else None
+                    if top_sources is not None and not top_sources.empty:
+                        top_source = top_sources.iloc[0]
+                        findings.append(f"• The most active source IP was {top_source['Network']} with "
+                                      f"{top_source['Count']} events")
                     
                     # 4. Anomaly finding
                     if numeric_cols:
-                        findings.append("• Statistical analysis identified several anomalies requiring investigation")
+                        anomaly_summary = selection_anomalies(df, profile, numeric_cols, analysis_cache,
+                                                              anomaly_method, anomaly_threshold)[1]
+                        anomaly_values = int(anomaly_summary['Anomalies'].sum())
+                        if anomaly_values:
+                            findings.append(f"• Statistical analysis flagged {anomaly_values:,} anomalous values "
+                                            "requiring investigation")
                     
                     for finding in findings:
                         elements.append(Paragraph(finding, styles['BodyText']))
@@ -1194,7 +1907,7 @@ else:
                     if 'event_type' in df.columns:
                         metrics_data.extend([
                             ["Most Common Threat", top_threat],
-                            ["Threat Diversity", f"{df['event_type'].nunique()} unique types"]
+                            ["Threat Diversity", f"{len(event_counts)} unique types"]
                         ])
                     
                     metrics_table = Table(metrics_data, colWidths=[2.5*inch, 2.5*inch])
@@ -1220,9 +1933,9 @@ else:
                     dataset_stats = [
                         ["Total Records", f"{len(df):,}"],
                         ["Total Columns", len(df.columns)],
-                        ["Missing Values", f"{df.isnull().sum().sum():,}"],
-                        ["Duplicate Rows", f"{df.duplicated().sum():,}"],
-                        ["Memory Usage", f"{df.memory_usage(deep=True).sum() / (1024*1024):.2f} MB"]
+                        ["Missing Values", f"{sum(stats['nulls'] for stats in profile['columns'].values()):,}"],
+                        ["Duplicate Rows", f"{analysis_cache['duplicate_rows']:,}"],
+                        ["Memory Usage", f"{sum(f['meta']['memory_after'] for f in selected_files) / (1024*1024):.2f} MB"]
                     ]
                     
                     if datetime_cols:
@@ -1250,11 +1963,8 @@ else:
                     # Column information
                     elements.append(Paragraph("Column Information", styles['Heading2SOC']))
                     
-                    col_info = df.dtypes.reset_index()
-                    col_info.columns = ['Column', 'Data Type']
-                    col_info['Unique Values'] = [df[col].nunique() for col in df.columns]
-                    col_info['Missing Values'] = df.isnull().sum().values
-                    col_info['% Missing'] = (df.isnull().sum().values / len(df) * 100).round(1)
+                    col_info = column_summary(profile, df.dtypes, approx_distinct_rows).rename(columns={'Type': 'Data Type'})
+                    col_info['% Missing'] = col_info['% Missing'].round(1)
                     
                     col_data = [col_info.columns.tolist()] + col_info.values.tolist()
                     col_table = Table(col_data, repeatRows=1, colWidths=[1.5*inch, 1*inch, 1*inch, 1*inch, 1*inch])
@@ -1281,7 +1991,7 @@ else:
                     if 'event_type' in df.columns:
                         elements.append(Paragraph("Event Type Distribution", styles['Heading2SOC']))
                         
-                        threat_counts = df['event_type'].value_counts().reset_index()
+                        threat_counts = dataset_view.value_counts('event_type').reset_index()
                         threat_counts.columns = ['Event Type', 'Count']
                         threat_counts['Percentage'] = (threat_counts['Count'] / len(df) * 100).round(1)
                         
@@ -1303,8 +2013,8 @@ else:
                         
                         # Generate plot
                         plt.figure(figsize=(8, 4))
-                        top_threats = df['event_type'].value_counts().nlargest(10)
-                        sns.barplot(x=top_threats.values, y=top_threats.index, palette='Reds_r')
+                        top_threats = threat_counts.set_index('Event Type')['Count'].nlargest(10)
+                        sns.barplot(x=top_threats.values, y=top_threats.index.astype(str), palette='Reds_r')
                         plt.title('Top 10 Threat Types')
                         plt.xlabel('Count')
                         plt.ylabel('')
@@ -1321,8 +2031,8 @@ else:
                     if 'source_ip' in df.columns:
                         elements.append(Paragraph("Source IP Analysis", styles['Heading2SOC']))
                         
-                        top_sources = df['source_ip'].value_counts().nlargest(10).reset_index()
-                        top_sources.columns = ['Source IP', 'Count']
+                        top_sources = ip_rollup(selected_files, analysis_cache, 'source_ip').rename(
+                            columns={'Network': 'Source IP'})
                         
                         source_data = [top_sources.columns.tolist()] + top_sources.values.tolist()
                         source_table = Table(source_data, repeatRows=1)
@@ -1344,8 +2054,8 @@ else:
                     if 'destination_ip' in df.columns:
                         elements.append(Paragraph("Destination IP Analysis", styles['Heading2SOC']))
                         
-                        top_dests = df['destination_ip'].value_counts().nlargest(10).reset_index()
-                        top_dests.columns = ['Destination IP', 'Count']
+                        top_dests = ip_rollup(selected_files, analysis_cache, 'destination_ip').rename(
+                            columns={'Network': 'Destination IP'})
                         
                         dest_data = [top_dests.columns.tolist()] + top_dests.values.tolist()
                         dest_table = Table(dest_data, repeatRows=1)
@@ -1368,32 +2078,38 @@ else:
                     toc.append(("Anomaly Detection", "5"))
                     elements.append(Paragraph("Anomaly Detection", styles['Heading1SOC']))
                     
+                    if anomaly_method == 'mad':
+                        method_text = "a robust z-score threshold of {} scaled median absolute deviations from the median"
+                        center_label, scale_label = "Median", "Scaled MAD"
+                    else:
+                        method_text = "a z-score threshold of {} standard deviations from the mean"
+                        center_label, scale_label = "Mean", "Standard Deviation"
                     elements.append(Paragraph(
-                        f"Statistical anomaly detection was performed using a z-score threshold of {anomaly_threshold} "
-                        "standard deviations from the mean. The following anomalies were identified:",
+                        f"Statistical anomaly detection was performed using {method_text.format(anomaly_threshold)}. "
+                        "The following anomalies were identified:",
                         styles['BodyTextJustify']
                     ))
                     elements.append(Spacer(1, 12))
                     
-                    # Analyze each numeric column
-                    for col in numeric_cols:
-                        mean = df[col].mean()
-                        std = df[col].std()
-                        
-                        if std > 0:  # Avoid division by zero
-                            df['z_score'] = (df[col] - mean) / std
-                            anomalies = df[abs(df['z_score']) > anomaly_threshold]
+                    # Every numeric column was scored in one pass; the same cached result backs the UI expander
+                    anomaly_hits, anomaly_summary = selection_anomalies(df, profile, numeric_cols, analysis_cache,
+                                                                        anomaly_method, anomaly_threshold)
+                    for col, center, scale in zip(anomaly_summary['Column'], anomaly_summary['Center'],
+                                                  anomaly_summary['Scale']):
+                        if scale > 0:  # Avoid division by zero
+                            z_scores = anomaly_hits[col]
+                            anomalies = df.iloc[z_scores.index].assign(z_score=z_scores.to_numpy())
                             
                             if not anomalies.empty:
                                 elements.append(Paragraph(f"Column: {col}", styles['Heading2SOC']))
                                 
                                 anomaly_stats = [
                                     ["Metric", "Value"],
-                                    ["Mean", f"{mean:.2f}"],
-                                    ["Standard Deviation", f"{std:.2f}"],
+                                    [center_label, f"{center:.2f}"],
+                                    [scale_label, f"{scale:.2f}"],
                                     ["Anomaly Threshold", f"{anomaly_threshold}σ"],
                                     ["Total Anomalies", f"{len(anomalies):,}"],
-                                    ["Max Z-Score", f"{df['z_score'].abs().max():.2f}"],
+                                    ["Max Z-Score", f"{z_scores.abs().max():.2f}"],
                                     ["% of Data", f"{len(anomalies)/len(df)*100:.1f}%"]
                                 ]
                                 
@@ -1430,6 +2146,39 @@ else:
                                 elements.append(sample_table)
                                 elements.append(Spacer(1, 12))
                     
+                    # Hosts and users whose busiest hour stands out against their own history
+                    entity_cols = [col for col in df.columns if ENTITY_NAME_HINT.search(col)]
+                    if entity_cols and datetime_cols:
+                        elements.append(Paragraph("Entity Baselines", styles['Heading2SOC']))
+                        elements.append(Paragraph(
+                            "Each entity's busiest hour compared with its own hourly event rate since it was first seen.",
+                            styles['BodyTextJustify']
+                        ))
+                        for entity_col in entity_cols:
+                            top_entities = entity_baselines(df, analysis_cache, numeric_cols, ipv4_columns,
+                                                            entity_col, datetime_cols[0], '1h', None, 5)
+                            if top_entities.empty:
+                                continue
+                            entity_data = [[entity_col, 'Events', 'Baseline/h', 'Peak', 'Peak Time', 'Score']] + [
+                                [row['Entity'], f"{row['Events']:,}", f"{row['Baseline']:.2f}", f"{row['Peak']:.0f}",
+                                 row['Peak Time'].strftime('%Y-%m-%d %H:%M'), f"{row['Score']:.1f}"]
+                                for _, row in top_entities.iterrows()
+                            ]
+                            entity_table = Table(entity_data, repeatRows=1)
+                            entity_table.setStyle(TableStyle([
+                                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#ff9f1c')),
+                                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                                ('FONTSIZE', (0, 0), (-1, 0), 9),
+                                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                                ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#f8f9fa')),
+                                ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#d1d5db')),
+                                ('FONTSIZE', (0, 1), (-1, -1), 8)
+                            ]))
+                            elements.append(entity_table)
+                            elements.append(Spacer(1, 12))
+                    
                     elements.append(Spacer(1, 24))
                 
                 # Timeline Analysis
@@ -1441,7 +2190,7 @@ else:
                     elements.append(Paragraph(f"Analyzing events by: {time_col}", styles['Heading2SOC']))
                     
                     # Hourly distribution
-                    hourly_events = df.set_index(time_col).resample('H').size()
+                    hourly_events = rollup_series(time_rollup(df, analysis_cache, numeric_cols, time_col), 'h')['count']
                     peak_hour = hourly_events.idxmax().strftime('%H:%M')
                     
                     elements.append(Paragraph(
@@ -1467,7 +2216,7 @@ else:
                     elements.append(Spacer(1, 12))
                     
                     # Daily distribution
-                    daily_events = df.set_index(time_col).resample('D').size()
+                    daily_events = rollup_series(time_rollup(df, analysis_cache, numeric_cols, time_col), 'D')['count']
                     peak_day = daily_events.idxmax().strftime('%Y-%m-%d')
                     
                     elements.append(Paragraph(
@@ -1502,8 +2251,7 @@ else:
                             # Communication patterns
                             elements.append(Paragraph("Top Communication Pairs", styles['Heading2SOC']))
                             
-                            comm_pairs = df.groupby(['source_ip', 'destination_ip']).size() \
-                                         .nlargest(10).reset_index(name='Count')
+                            comm_pairs = ip_pair_rollup(selected_files, analysis_cache)
                             
                             comm_data = [['Source IP', 'Destination IP', 'Count']] + comm_pairs.values.tolist()
                             comm_table = Table(comm_data, repeatRows=1)
@@ -1526,18 +2274,10 @@ else:
                     toc.append(("Correlation Findings", "8"))
                     elements.append(Paragraph("Correlation Findings", styles['Heading1SOC']))
                     
-                    corr_matrix = df[numeric_cols].corr()
+                    corr_matrix = selection_correlation(df, profile, numeric_cols)
                     
-                    # Find strongest correlations
-                    corr_pairs = []
-                    for i in range(len(corr_matrix.columns)):
-                        for j in range(i):
-                            if abs(corr_matrix.iloc[i, j]) > 0.5:  # Only show moderate/strong correlations
-                                corr_pairs.append([
-                                    corr_matrix.columns[i],
-                                    corr_matrix.columns[j],
-                                    f"{corr_matrix.iloc[i, j]:.2f}"
-                                ])
+                    # Find strongest correlations (only moderate/strong ones are shown)
+                    corr_pairs = [[a, b, f"{r:.2f}"] for a, b, r in strong_correlations(corr_matrix, 0.5)]
                     
                     if corr_pairs:
                         elements.append(Paragraph(
@@ -1591,27 +2331,29 @@ else:
                     ))
                     elements.append(Spacer(1, 12))
                     
-                    # Sample threat intel findings (in real app, use actual threat intel feeds)
-                    intel_findings = [
-                        {
-                            "title": "Malicious IP Detection",
-                            "detail": "3 source IPs matched known malicious IPs in threat databases",
-                            "severity": "High",
-                            "ips": ["192.168.1.105", "10.0.0.12", "172.16.0.8"]
-                        },
-                        {
-                            "title": "Suspicious User Agents",
-                            "detail": "5 requests contained user agents associated with scanning tools",
-                            "severity": "Medium",
-                            "examples": ["Nmap Scripting Engine", "sqlmap", "nikto"]
-                        },
-                        {
-                            "title": "Known Exploit Patterns",
-                            "detail": "12 events matched signatures of known vulnerabilities (CVE-2023-1234, CVE-2023-5678)",
-                            "severity": "Critical",
-                            "affected": ["Web servers", "API endpoints"]
-                        }
-                    ]
+                    # One finding per indicator type matched against the loaded feeds
+                    intel_findings = []
+                    if ioc_index is None:
+                        elements.append(Paragraph(
+                            "No threat intelligence feeds were loaded for this analysis.",
+                            styles['FindingDetail']
+                        ))
+                    else:
+                        ioc_matches, _ = selection_ioc_matches(df, analysis_cache, ioc_key, ioc_index, ipv4_columns)
+                        for ioc_type, matches in ioc_matches.groupby('Type', sort=False):
+                            finding = {
+                                "title": f"{IOC_TYPE_LABELS[ioc_type]} Detection",
+                                "detail": f"{len(matches):,} indicators from {', '.join(matches['Source'].unique())} "
+                                          f"matched {matches['Events'].sum():,} events in {', '.join(matches['Column'].unique())}",
+                                "severity": "High" if ioc_type in ('ipv4', 'hash') else "Medium",
+                            }
+                            finding['ips' if ioc_type == 'ipv4' else 'examples'] = matches['Indicator'].head(10).tolist()
+                            intel_findings.append(finding)
+                        if not intel_findings:
+                            elements.append(Paragraph(
+                                f"No events matched the {ioc_index['size']:,} loaded indicators.",
+                                styles['FindingDetail']
+                            ))
                     
                     for finding in intel_findings:
                         elements.append(Paragraph(
@@ -1632,12 +2374,6 @@ else:
                                 styles['FindingDetail']
                             ))
                         
-                        if 'affected' in finding:
-                            elements.append(Paragraph(
-                                "Affected Systems: " + ", ".join(finding['affected']),
-                                styles['FindingDetail']
-                            ))
-                        
                         elements.append(Spacer(1, 8))
                     
                     elements.append(Spacer(1, 24))
@@ -1720,7 +2456,7 @@ else:
                         styles['BodyTextJustify']
                     ))
                     
-                    sample_data = [df.columns.tolist()] + df.head(5).values.tolist()
+                    sample_data = [df.columns.tolist()] + display_frame(df.head(5), ipv4_columns).values.tolist()
                     sample_table = Table(sample_data, repeatRows=1)
                     sample_table.setStyle(TableStyle([
                         ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1a3e72')),
@@ -0,0 +1,2412 @@
+"""Data processing helpers for SOC Analyzer Pro (kept free of Streamlit so worker processes can import them)"""
+import datetime
+import fnmatch
+import functools
+import hashlib
+import io
+import ipaddress
+import json
+import os
+import pickle
+import re
+import socket
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow
+    from pyarrow import compute as pyarrow_compute
+    from pyarrow import csv as pyarrow_csv
+except ImportError:
+    pyarrow = None
+    pyarrow_compute = None
+    pyarrow_csv = None
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+# Persistent dataset cache settings
+DATASET_CACHE_DIR = os.environ.get(
+    'SOC_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'soc_analyzer', 'datasets')
+)
+DATASET_CACHE_MAX_BYTES = int(os.environ.get('SOC_CACHE_MAX_BYTES', 20 * 1024 ** 3))
+HASH_BLOCK_SIZE = 8 * 1024 * 1024
+
+# CSV ingestion settings
+CSV_CHUNK_ROWS = 250_000
+ENCODING_SAMPLE_BYTES = 1024 * 1024
+CSV_ENGINES = {
+    'streaming': "Streaming (chunked, bounded memory)",
+    'pyarrow': "PyArrow (multi-threaded)",
+    'pandas': "Pandas (single pass)",
+}
+if pyarrow is None:
+    del CSV_ENGINES['pyarrow']
+
+# Memory compaction settings
+CATEGORY_MAX_RATIO = 0.5
+IPV4_PATTERN = re.compile(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$')
+IPV4_SAMPLE_ROWS = 1000
+# Values that stand for "no address" in exported IP columns; they are packed as missing
+IP_PLACEHOLDERS = frozenset({'', '-', '--', 'unknown', 'n/a', 'na', 'none', 'null', 'nan'})
+# Text columns whose sample is at least this share of IPv4/IPv6 addresses are parsed at ingest
+IP_COLUMN_MIN_RATE = 0.5
+
+# Timestamp inference settings
+TIMESTAMP_SAMPLE_ROWS = 500
+TIMESTAMP_MIN_PARSE_RATE = 0.9
+TIMESTAMP_NAME_HINT = re.compile(r'time|date|_ts$|^ts|epoch|created|updated|seen', re.IGNORECASE)
+TIMESTAMP_FORMATS = [
+    'ISO8601',                      # 2024-01-31T13:45:00Z, 2024-01-31 13:45:00.123
+    '%d/%b/%Y:%H:%M:%S %z',         # Apache/NGINX access logs
+    '%b %d %H:%M:%S',               # RFC 3164 syslog (no year)
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%Y %I:%M:%S %p',
+    '%d/%m/%Y %H:%M:%S',
+    '%m/%d/%Y %H:%M',
+    '%d-%b-%Y %H:%M:%S',
+    '%a %b %d %H:%M:%S %Y',         # ctime
+]
+# Plausible magnitudes (roughly 1973-2286) of epoch timestamps per unit
+EPOCH_UNITS = {'s': (1e8, 1e10), 'ms': (1e11, 1e13), 'us': (1e14, 1e16), 'ns': (1e17, 1e19)}
+
+# Column profile settings
+PROFILE_SAMPLE_ROWS = 10_000
+PROFILE_QUANTILES = [0.25, 0.5, 0.75]
+# Exact distinct-value hashes are kept up to this many per column (low-cardinality labels);
+# above it only the HyperLogLog sketch is kept, which is always built, so such columns
+# are estimated whatever the row threshold below
+PROFILE_EXACT_DISTINCT_MAX = 10_000
+# Rows per Gram-matrix product when accumulating the numeric co-moments of a file (cache-sized blocks)
+PROFILE_COMOMENT_CHUNK_ROWS = 100_000
+HLL_PRECISION = 14
+HLL_RELATIVE_ERROR = 1.04 / np.sqrt(2 ** HLL_PRECISION)   # standard error, about 0.8%
+# Selections with more rows than this report every distinct count as an estimate
+APPROX_DISTINCT_MIN_ROWS = 1_000_000
+
+# Anomaly scoring: center and scale of each numeric column
+ANOMALY_METHODS = {
+    'zscore': "Z-score (mean, standard deviation)",
+    'mad': "Robust (median, MAD)",
+}
+MAD_SCALE = 1.4826   # makes the median absolute deviation estimate σ for normal data
+
+# Multivariate (Mahalanobis) anomaly scoring
+MULTIVARIATE_SAMPLE_ROWS = 100_000
+MULTIVARIATE_CHUNK_ROWS = 1_000_000
+
+# Plot payload limits: long series are reduced to per-bucket extremes and drawn with WebGL
+PLOT_MAX_BUCKETS = 5_000
+PLOT_WEBGL_ROWS = 10_000
+DISTRIBUTION_RAW_ROWS = 50_000      # above this, distribution plots are drawn from distribution_summary
+DISTRIBUTION_MAX_BINS = 200
+DISTRIBUTION_GRID_POINTS = 512
+DISTRIBUTION_ECDF_POINTS = 1_000
+DISTRIBUTION_MAX_OUTLIERS = 1_000
+
+# Time-series rollup cube levels (pandas offset aliases), finest first
+ROLLUP_LEVELS = ('min', 'h', 'D')
+
+# Per-entity behavioural baselines
+ENTITY_NAME_HINT = re.compile(r'(?:^|_)(?:ip|user|username|host|hostname|account)$', re.IGNORECASE)
+ENTITY_MIN_BUCKETS = 3
+ENTITY_TOP_K = 10
+
+# Seasonal baselines for resampled time series
+SEASONAL_PERIODS = {'week': "Hour of week", 'day': "Hour of day"}
+SEASONAL_WINDOW = 4          # periods (weeks or days) in each rolling baseline, the current one included
+SEASONAL_MIN_POINTS = 4      # buckets a baseline needs before its hour is scored (and never under two periods' worth)
+# Multiple of the pooled residual spread below which a baseline's spread is not trusted; above 1
+# because each baseline includes its own bucket, which shrinks the residuals
+SEASONAL_SCALE_FLOOR = 1.25
+
+# Built-in threat signatures (bit i of a signature mask is the i-th entry)
+THREAT_PATTERNS = {
+    'SQL Injection': r'(?:\bunion\b.*\bselect\b|\bselect\b.*\bfrom\b|\binsert\b.*\binto\b)',
+    'XSS': r'(?:\bscript\b|\balert\b|\bonerror\b|\bonload\b)',
+    'RCE': r'(?:\bsystem\b|\bexec\b|\beval\b|\bcmd\b)',
+    'LFI/RFI': r'(?:\.\./|\.\\|\\\.\.|\binclude\b|\brequire\b)'
+}
+
+# Distinct values per process-pool job when scanning text columns
+SIGNATURE_SHARD_VALUES = 250_000
+
+# Signature rule packs (a Sigma-like subset, see README)
+RULE_PACKS_DIR = os.environ.get('SOC_RULES_DIR', '')
+RULE_MODIFIERS = ('contains', 'startswith', 'endswith', 're')
+RULE_LITERAL_MIN_LENGTH = 3
+RULE_CONDITION_TOKENS = re.compile(r'\(|\)|[^\s()]+')
+
+# Threat-intelligence (IOC) feeds
+IOC_FEEDS_DIR = os.environ.get('SOC_IOC_DIR', '')
+IOC_TYPE_PATTERNS = {
+    'cidr': r'^\d{1,3}(?:\.\d{1,3}){3}/\d{1,2}$',
+    'ipv4': IPV4_PATTERN.pattern,
+    'hash': r'^(?:[0-9a-f]{32}|[0-9a-f]{40}|[0-9a-f]{64})$',
+    'url': r'^[a-z][a-z0-9+.-]*://',
+    'domain': r'^(?:[a-z0-9_-]+\.)+[a-z]{2,}$',
+}
+IOC_TYPE_LABELS = {'ipv4': "Malicious IP", 'domain': "Malicious Domain", 'url': "Malicious URL", 'hash': "Malicious File Hash"}
+STIX_PATTERN = re.compile(r"\[(?:ipv4-addr|domain-name|url|file):[\w.']+\s*=\s*'([^']+)'\]")
+URL_HOST_PATTERN = r'^[a-z][a-z0-9+.-]*://(?:[^@/]*@)?([^/:?#]+)'
+
+# Default network sizes for IP rollups
+SUBNET_PREFIX_V4 = 24
+SUBNET_PREFIX_V6 = 64
+
+# Watch mode: follow CSV exports that keep growing in a local file or directory
+WATCH_PATH = os.environ.get('SOC_WATCH_PATH', '')
+WATCH_INTERVAL_SECONDS = 60
+WATCH_RETENTION_MINUTES = 24 * 60
+WATCH_MAX_READ_BYTES = 64 * 1024 * 1024   # per file and refresh; larger backlogs drain over several refreshes
+WATCH_ROLLUP_FREQ = 'min'
+WATCH_ANOMALY_SAMPLE_ROWS = 100
+
+# Bumped whenever prepare_frame changes, so older cache entries are re-prepared on load
+PREPARED_FRAME_VERSION = 2
+# Bumped whenever profile_frame or row_hashes change, so cached profiles are recomputed
+PROFILE_VERSION = 4
+
+
+def clean_column_names(df):
+    """Clean column names by removing special characters and making them lowercase"""
+    df.columns = [re.sub(r'[^a-zA-Z0-9_]', '', col).lower() for col in df.columns]
+    return df
+
+
+def detect_sensitive_columns(df):
+    """Identify potentially sensitive columns"""
+    sensitive_keywords = ['password', 'secret', 'key', 'token', 'credit', 'ssn', 'personal']
+    return [col for col in df.columns if any(kw in col.lower() for kw in sensitive_keywords)]
+
+
+def file_sha256(file):
+    """Return the SHA-256 hex digest of an uploaded file's bytes without copying them"""
+    digest = hashlib.sha256()
+    buffer = file.getbuffer()
+    try:
+        for start in range(0, len(buffer), HASH_BLOCK_SIZE):
+            digest.update(buffer[start:start + HASH_BLOCK_SIZE])
+    finally:
+        buffer.release()
+    return digest.hexdigest()
+
+
+def dataset_cache_enabled():
+    """The on-disk cache needs pyarrow for Parquet I/O and a positive size budget"""
+    return pyarrow is not None and DATASET_CACHE_MAX_BYTES > 0
+
+
+def _cache_paths(digest):
+    base = os.path.join(DATASET_CACHE_DIR, digest)
+    return base + '.parquet', base + '.json', base + '.profile.pkl'
+
+
+def load_cached_dataset(digest):
+    """Load a cleaned dataset from the cache, returning (df, meta) or None on a miss"""
+    if not dataset_cache_enabled():
+        return None
+    data_path, meta_path, _ = _cache_paths(digest)
+    if not os.path.exists(data_path):
+        return None
+    try:
+        df = pd.read_parquet(data_path, engine='pyarrow')
+        meta = {}
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+    except Exception:
+        # A truncated or incompatible entry is treated as a miss and dropped
+        _remove_cache_entry(digest)
+        return None
+    # Touch the entry so eviction treats it as recently used
+    now = time.time()
+    os.utime(data_path, (now, now))
+    return df, meta
+
+
+def load_cached_profile(digest, rows):
+    """Load the column profile and row hashes stored with a cached dataset as (profile, hashes), or None"""
+    if not dataset_cache_enabled():
+        return None
+    profile_path = _cache_paths(digest)[2]
+    try:
+        with open(profile_path, 'rb') as f:
+            entry = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        _remove_path(profile_path)
+        return None
+    # Profiles from an older layout (or of another frame) are recomputed by the caller
+    if entry.get('version') != PROFILE_VERSION or len(entry['row_hashes']) != rows:
+        return None
+    return entry['profile'], entry['row_hashes']
+
+
+def store_cached_profile(digest, profile, hashes):
+    """Write a dataset's column profile and row hashes next to its cache entry; returns True if stored"""
+    if not dataset_cache_enabled():
+        return False
+    profile_path = _cache_paths(digest)[2]
+    tmp_path = f"{profile_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(DATASET_CACHE_DIR, exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'version': PROFILE_VERSION, 'profile': profile, 'row_hashes': hashes}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, profile_path)
+    except Exception:
+        _remove_path(tmp_path)
+        return False
+    return True
+
+
+def store_cached_dataset(digest, df, meta=None, profile=None, hashes=None):
+    """Write a cleaned dataset, plus its profile and row hashes when given, to the cache; True if stored"""
+    if not dataset_cache_enabled():
+        return False
+    data_path, meta_path, profile_path = _cache_paths(digest)
+    tmp_path = f"{data_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(DATASET_CACHE_DIR, exist_ok=True)
+        df.to_parquet(tmp_path, engine='pyarrow', index=False)
+        with open(meta_path, 'w') as f:
+            json.dump(meta or {}, f)
+        os.replace(tmp_path, data_path)
+    except Exception:
+        # Columns pyarrow cannot represent (e.g. mixed-type objects) are simply not cached
+        _remove_path(tmp_path)
+        return False
+    if profile is not None:
+        store_cached_profile(digest, profile, hashes)
+    else:
+        _remove_path(profile_path)   # a profile of the previous contents no longer applies
+    evict_dataset_cache()
+    return True
+
+
+def _remove_path(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _remove_cache_entry(digest):
+    for path in _cache_paths(digest):
+        _remove_path(path)
+
+
+def evict_dataset_cache(max_bytes=None):
+    """Delete least recently used cache entries until the cache fits in max_bytes
+
+    Pool workers evict concurrently, so an entry that disappears mid-scan is skipped.
+    """
+    max_bytes = DATASET_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    try:
+        scanned = [e for e in os.scandir(DATASET_CACHE_DIR) if e.name.endswith('.parquet')]
+    except OSError:
+        return
+    entries = []
+    for entry in scanned:
+        profile_path = _cache_paths(entry.name[:-len('.parquet')])[2]
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        try:
+            profile_size = os.path.getsize(profile_path)
+        except OSError:
+            profile_size = 0
+        entries.append((stat.st_mtime, stat.st_size + profile_size, entry.name))
+    entries.sort(reverse=True)
+    total = 0
+    for _, size, name in entries:
+        total += size
+        if total > max_bytes:
+            _remove_cache_entry(name[:-len('.parquet')])
+
+
+def downcast_numeric(df):
+    """Shrink integer columns to the smallest dtype and floats to float32 where that is lossless"""
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_bool_dtype(series) or not pd.api.types.is_numeric_dtype(series):
+            continue
+        if pd.api.types.is_integer_dtype(series) and not pd.api.types.is_extension_array_dtype(series):
+            kind = 'unsigned' if len(series) and series.min() >= 0 else 'integer'
+            df[col] = pd.to_numeric(series, downcast=kind)
+        elif series.dtype == np.float64:
+            values = series.to_numpy()
+            narrowed = values.astype(np.float32)
+            if np.array_equal(narrowed.astype(np.float64), values, equal_nan=True):
+                df[col] = narrowed
+    return df
+
+
+def detect_encoding(file, sample_bytes=ENCODING_SAMPLE_BYTES):
+    """Pick a text encoding from the leading bytes of an upload so the parser runs only once"""
+    buffer = file.getbuffer()
+    try:
+        sample = bytes(buffer[:sample_bytes])
+    finally:
+        buffer.release()
+    if sample.startswith(b'\xef\xbb\xbf'):
+        return 'utf-8-sig'
+    if sample.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return 'utf-16'
+    try:
+        sample.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off by the sample boundary is still valid UTF-8
+        if e.reason != 'unexpected end of data' or e.start < len(sample) - 3:
+            return 'latin1'
+    return 'utf-8'
+
+
+def read_csv_arrow(file, encoding='utf-8'):
+    """Parse a CSV upload with Arrow's multi-threaded reader, without copying the upload bytes"""
+    read_options = pyarrow_csv.ReadOptions(use_threads=True, encoding=encoding)
+    source = pyarrow.BufferReader(pyarrow.py_buffer(file.getbuffer()))
+    table = pyarrow_csv.read_csv(source, read_options=read_options)
+    # Arrow types a column as binary when invalid UTF-8 appears after the sampled prefix
+    undecoded = [field.name for field in table.schema
+                 if pyarrow.types.is_binary(field.type) or pyarrow.types.is_large_binary(field.type)]
+    if undecoded and encoding != 'latin1':
+        del table
+        return read_csv_arrow(file, 'latin1')
+    # self_destruct frees each Arrow column as soon as it has been converted
+    return downcast_numeric(table.to_pandas(self_destruct=True, split_blocks=True))
+
+
+def infer_timestamp_format(series):
+    """Resolve one explicit timestamp format for a column from a sample, or None
+
+    Returns 'epoch:<unit>' for numeric epoch columns, otherwise a strptime format
+    (or 'ISO8601') that parses at least TIMESTAMP_MIN_PARSE_RATE of the sample.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return None
+    sample = series.dropna().head(TIMESTAMP_SAMPLE_ROWS)
+    if sample.empty:
+        return None
+    
+    if pd.api.types.is_numeric_dtype(series):
+        if not TIMESTAMP_NAME_HINT.search(str(series.name)):
+            return None
+        for unit, (low, high) in EPOCH_UNITS.items():
+            if sample.between(low, high).all():
+                return f'epoch:{unit}'
+        return None
+    
+    if not is_text_column(series):
+        return None
+    sample = sample.astype(str)
+    lengths = sample.str.len()
+    if not (lengths.between(8, 40).all() and sample.str.contains(r'\d', regex=True).all()):
+        return None
+    best_format, best_rate = None, TIMESTAMP_MIN_PARSE_RATE
+    for fmt in TIMESTAMP_FORMATS:
+        parsed = _parse_timestamps(sample, fmt)
+        rate = parsed.notna().mean()
+        if rate > best_rate or (rate == 1.0 and best_format is None):
+            best_format, best_rate = fmt, rate
+        if rate == 1.0:
+            break
+    return best_format
+
+
+def _parse_timestamps(values, fmt):
+    """Vectorised parse of strings with one explicit format into naive (UTC) datetimes"""
+    if fmt == '%b %d %H:%M:%S':
+        # Syslog omits the year; assume the current one
+        values = f"{datetime.date.today().year} " + values
+        fmt = '%Y ' + fmt
+    if fmt == 'ISO8601' or '%z' in fmt:
+        parsed = pd.to_datetime(values, format=fmt, errors='coerce', utc=True)
+        return parsed.dt.tz_localize(None)
+    return pd.to_datetime(values, format=fmt, errors='coerce')
+
+
+def convert_timestamps(series, fmt):
+    """Convert a column to datetime64 using a format from infer_timestamp_format"""
+    if fmt.startswith('epoch:'):
+        return pd.to_datetime(series, unit=fmt.split(':', 1)[1], errors='coerce')
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Parse each distinct value once and broadcast through the codes
+        categories = _parse_timestamps(pd.Series(series.cat.categories.astype(str)), fmt)
+        codes = series.cat.codes.to_numpy()
+        values = categories.to_numpy()[np.where(codes < 0, 0, codes)] if len(categories) else []
+        return pd.Series(values, index=series.index, name=series.name).where(codes >= 0)
+    return _parse_timestamps(series.astype(str).where(series.notna()), fmt)
+
+
+def infer_timestamp_columns(df, skip=()):
+    """Convert timestamp-like columns in place, returning the format resolved for each"""
+    formats = {}
+    for col in df.columns:
+        if col in skip:
+            continue
+        fmt = infer_timestamp_format(df[col])
+        if fmt is not None:
+            df[col] = convert_timestamps(df[col], fmt)
+            formats[col] = fmt
+    return formats
+
+
+def is_text_column(series):
+    """Object, string and categorical columns hold free text or labels"""
+    return (
+        isinstance(series.dtype, (pd.CategoricalDtype, pd.StringDtype))
+        or pd.api.types.is_object_dtype(series)
+    )
+
+
+def _ipv4_strings_to_int(values):
+    """Convert an array of dotted-quad strings to uint32, or return None if any is not IPv4"""
+    if pyarrow is not None:
+        # Arrow splits and casts in C, an order of magnitude faster on million-entry arrays
+        try:
+            parts = pyarrow_compute.split_pattern(pyarrow.array(values, type=pyarrow.string()), '.')
+            if len(values) and not pyarrow_compute.all(pyarrow_compute.equal(pyarrow_compute.list_value_length(parts), 4)).as_py():
+                return None
+            octets = pyarrow_compute.cast(pyarrow_compute.list_flatten(parts), pyarrow.uint16()).to_numpy()
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+            return None
+        octets = octets.reshape(-1, 4).astype(np.uint32)
+        if (octets > 255).any():
+            return None
+        return (octets[:, 0] << 24) | (octets[:, 1] << 16) | (octets[:, 2] << 8) | octets[:, 3]
+    parts = pd.Series(values, dtype=object).str.split('.', expand=True)
+    if parts.shape[1] != 4:
+        return None
+    octets = parts.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+    if np.isnan(octets).any() or (octets > 255).any() or (octets < 0).any():
+        return None
+    octets = octets.astype(np.uint32)
+    return (octets[:, 0] << 24) | (octets[:, 1] << 16) | (octets[:, 2] << 8) | octets[:, 3]
+
+
+def _ip_placeholders(values):
+    """Mask of the entries of a string array that are IP_PLACEHOLDERS"""
+    return pd.Series(values, dtype=object).astype(str).str.strip().str.lower().isin(IP_PLACEHOLDERS).to_numpy()
+
+
+def pack_ipv4(series):
+    """Pack an IPv4 string column into nullable UInt32, returning None if it is not pure IPv4
+
+    Placeholders such as '-' or 'unknown' (IP_PLACEHOLDERS) are packed as missing.
+    """
+    sample = series.dropna().head(IPV4_SAMPLE_ROWS).astype(str)
+    is_address = sample.str.match(IPV4_PATTERN).to_numpy(dtype=bool)
+    if not is_address.any() or not (is_address | _ip_placeholders(sample.to_numpy(dtype=object))).all():
+        return None
+    # Convert each distinct address once, then broadcast through the factor codes
+    codes, uniques = pd.factorize(series)
+    uniques = np.asarray(uniques, dtype=object)
+    missing = _ip_placeholders(uniques)
+    packed = np.zeros(len(uniques), dtype=np.uint32)
+    if not missing.all():
+        addresses = _ipv4_strings_to_int(uniques[~missing])
+        if addresses is None:
+            return None
+        packed[~missing] = addresses
+    missing = np.append(missing, True)[codes]
+    values = packed[np.where(codes < 0, 0, codes)] if len(packed) else np.zeros(len(codes), np.uint32)
+    return pd.Series(pd.arrays.IntegerArray(values, missing), index=series.index, name=series.name)
+
+
+def unpack_ipv4(values):
+    """Render packed IPv4 integers back to dotted-quad strings (missing values stay missing)"""
+    values = pd.Series(values)
+    codes, uniques = pd.factorize(values)
+    ints = np.asarray(uniques, dtype=np.int64)
+    labels = np.array(
+        [f"{(v >> 24) & 255}.{(v >> 16) & 255}.{(v >> 8) & 255}.{v & 255}" for v in ints.tolist()] + [None],
+        dtype=object
+    )
+    return pd.Series(labels[codes], index=values.index, name=values.name, dtype=object)
+
+
+def compact_frame(df, skip=()):
+    """Shrink a cleaned frame in place of the parser's dtypes and report the memory saved
+
+    Low-cardinality strings become categoricals, pure IPv4 columns are packed into
+    UInt32 (see unpack_ipv4 for display) and numeric columns are downcast. Text
+    columns in skip were already compacted (e.g. per streamed chunk) and are left.
+    """
+    memory_before = int(df.memory_usage(deep=True).sum())
+    ipv4_columns = []
+    for col in df.columns:
+        series = df[col]
+        if col in skip or isinstance(series.dtype, pd.CategoricalDtype) or not is_text_column(series):
+            continue
+        packed = pack_ipv4(series)
+        if packed is not None:
+            df[col] = packed
+            ipv4_columns.append(col)
+            continue
+        codes, uniques = pd.factorize(series)
+        if len(uniques) <= CATEGORY_MAX_RATIO * len(series):
+            df[col] = pd.Categorical.from_codes(codes, categories=uniques)
+    df = downcast_numeric(df)
+    meta = {
+        'ipv4_columns': ipv4_columns,
+        'memory_before': memory_before,
+        'memory_after': int(df.memory_usage(deep=True).sum()),
+    }
+    return df, meta
+
+
+def prepare_frame(df, earlier=None):
+    """Normalise a freshly parsed frame: clean names, type timestamps once, then compact
+
+    earlier is the meta of a pass that already typed part of the frame (streamed
+    chunks, or an older cache entry): its packed IPv4 columns, timestamp formats and
+    raw size are carried forward rather than lost or re-inferred.
+    """
+    earlier = earlier or {}
+    df = clean_column_names(df)
+    packed = [col for col in earlier.get('ipv4_columns', ()) if col in df.columns]
+    timestamp_formats = {col: fmt for col, fmt in earlier.get('timestamp_formats', {}).items() if col in df.columns}
+    timestamp_formats.update(infer_timestamp_columns(df, skip=packed + list(timestamp_formats)))
+    df, meta = compact_frame(df, skip=earlier.get('compacted_columns', ()))
+    meta['ipv4_columns'] = packed + meta['ipv4_columns']
+    meta['memory_before'] = earlier.get('memory_before', meta['memory_before'])
+    meta['timestamp_formats'] = timestamp_formats
+    meta['version'] = PREPARED_FRAME_VERSION
+    return df, meta
+
+
+def display_frame(df, ipv4_columns):
+    """Copy of a (small) frame with packed IPv4 columns rendered as strings for display"""
+    columns = [col for col in ipv4_columns if col in df.columns]
+    if not columns:
+        return df
+    df = df.copy()
+    for col in columns:
+        df[col] = unpack_ipv4(df[col])
+    return df
+
+
+def concat_frames(frames, ipv4_columns_per_frame):
+    """Concatenate datasets while keeping categoricals and packed IPv4 columns compact
+
+    Returns the combined frame and the IPv4 columns that are still packed in it.
+    """
+    packed = set().union(*ipv4_columns_per_frame)
+    keep_packed = {
+        col for col in packed
+        if all(col in cols for frame, cols in zip(frames, ipv4_columns_per_frame) if col in frame.columns)
+    }
+    # Shallow copies so harmonising dtypes never touches the per-file frames
+    prepared = [frame.copy(deep=False) for frame in frames]
+    for frame, cols in zip(prepared, ipv4_columns_per_frame):
+        # A column packed in one file but textual in another is unpacked so the types agree
+        for col in set(cols) - keep_packed:
+            frame[col] = unpack_ipv4(frame[col])
+    
+    for col in set().union(*[frame.columns for frame in prepared]):
+        series = [frame[col] for frame in prepared if col in frame.columns]
+        if len(series) > 1 and all(isinstance(s.dtype, pd.CategoricalDtype) for s in series):
+            categories = pd.api.types.union_categoricals(series, ignore_order=True).categories
+            for frame in prepared:
+                if col in frame.columns:
+                    frame[col] = frame[col].cat.set_categories(categories)
+    
+    combined = pd.concat(prepared, ignore_index=True)
+    return combined, sorted(keep_packed)
+
+
+class DatasetView:
+    """Virtual concatenation of per-file frames that analyses can iterate chunk by chunk
+
+    Nothing is copied until materialize() is called, so per-file aggregations over a
+    selection cost no more memory than the files themselves.
+    """
+
+    def __init__(self, frames, ipv4_columns_per_frame):
+        self.frames = list(frames)
+        self.ipv4_columns_per_frame = [list(cols) for cols in ipv4_columns_per_frame]
+
+    def __len__(self):
+        return sum(len(frame) for frame in self.frames)
+
+    @property
+    def columns(self):
+        seen = {}
+        for frame in self.frames:
+            seen.update(dict.fromkeys(frame.columns))
+        return list(seen)
+
+    def iter_chunks(self, columns=None, chunk_rows=None):
+        """Yield (frame, packed IPv4 columns) pieces, optionally limited to columns and rows per piece"""
+        for frame, ipv4_columns in zip(self.frames, self.ipv4_columns_per_frame):
+            if columns is not None:
+                frame = frame[[col for col in columns if col in frame.columns]]
+            step = chunk_rows or max(len(frame), 1)
+            for start in range(0, len(frame), step):
+                yield frame.iloc[start:start + step], ipv4_columns
+
+    def value_counts(self, column):
+        """Counts of each value of a column across all files, rendered as analysts see them"""
+        counts = []
+        for chunk, ipv4_columns in self.iter_chunks([column]):
+            if column not in chunk.columns:
+                continue
+            chunk_counts = chunk[column].value_counts()
+            chunk_counts = chunk_counts[chunk_counts > 0]
+            if column in ipv4_columns:
+                chunk_counts.index = unpack_ipv4(chunk_counts.index.to_series()).to_numpy()
+            else:
+                chunk_counts.index = chunk_counts.index.astype(object)
+            counts.append(chunk_counts)
+        if not counts:
+            return pd.Series(dtype='int64', name='count')
+        return pd.concat(counts).groupby(level=0).sum().sort_values(ascending=False)
+
+    def materialize(self):
+        """Concatenate into one frame, returning (frame, packed IPv4 columns)"""
+        if len(self.frames) == 1:
+            return self.frames[0], self.ipv4_columns_per_frame[0]
+        return concat_frames(self.frames, self.ipv4_columns_per_frame)
+
+
+def _ipv4_text_keys(text):
+    """Packed value of each dotted-quad string in an array of distinct strings, -1 for anything else"""
+    keys = np.full(len(text), -1, dtype=np.int64)
+    candidates = np.flatnonzero(pd.Series(text, dtype=object).str.match(IPV4_PATTERN).fillna(False).to_numpy(dtype=bool))
+    if not len(candidates):
+        return keys
+    packed = _ipv4_strings_to_int(text[candidates])
+    if packed is None:
+        # Some candidate has an octet above 255; keep only the real addresses
+        valid = [all(int(octet) <= 255 for octet in str(value).split('.')) for value in text[candidates]]
+        candidates = candidates[np.asarray(valid, dtype=bool)]
+        packed = _ipv4_strings_to_int(text[candidates]) if len(candidates) else np.empty(0, np.uint32)
+    keys[candidates] = packed
+    return keys
+
+
+def _ipv4_hashes(keys):
+    """64-bit hashes of packed IPv4 addresses, shared by packed columns and dotted-quad text"""
+    return pd.util.hash_array(np.asarray(keys, dtype=np.uint64), categorize=False)
+
+
+def _factorized_hashes(series, packed_ipv4=False):
+    """Factor codes of a column plus 64-bit hashes of its distinct values, normalised so files with different dtypes agree"""
+    codes, uniques = pd.factorize(series)
+    if packed_ipv4:
+        return codes, _ipv4_hashes(np.asarray(uniques, dtype=np.int64))
+    if is_text_column(series):
+        # IPv4 text hashes as its packed value, so it matches files where the column was packed
+        text = np.asarray(uniques, dtype=object).astype(str).astype(object)
+        hashes = pd.util.hash_array(text, categorize=False)
+        keys = _ipv4_text_keys(text)
+        addresses = keys >= 0
+        hashes[addresses] = _ipv4_hashes(keys[addresses])
+        return codes, hashes
+    if pd.api.types.is_datetime64_any_dtype(uniques):
+        values = np.asarray(uniques, dtype='datetime64[ns]').view(np.int64)
+    elif pd.api.types.is_bool_dtype(uniques):
+        values = np.asarray(uniques, dtype=bool)
+    elif pd.api.types.is_numeric_dtype(uniques):
+        values = np.asarray(uniques, dtype=np.float64)
+    else:
+        values = np.asarray(uniques, dtype=object).astype(str).astype(object)
+    return codes, pd.util.hash_array(values, categorize=False)
+
+
+def _distinct_hashes(series, packed_ipv4=False):
+    """Sorted 64-bit hashes of a column's distinct values"""
+    # The factorized values are already distinct, so a sort is enough
+    return np.sort(_factorized_hashes(series, packed_ipv4)[1])
+
+
+def _mix64(values):
+    """splitmix64 finaliser, so per-column hashes can be combined by addition"""
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def row_hashes(df, ipv4_columns=()):
+    """64-bit hash of every row, comparable across files whatever their dtypes or column order
+
+    Each non-null cell contributes a mix of its column name and value; nulls contribute
+    nothing, so a column a file lacks hashes the same as the missing values concat fills in.
+    """
+    totals = np.zeros(len(df), dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for col in df.columns:
+            codes, hashes = _factorized_hashes(df[col], col in ipv4_columns)
+            name_hash = pd.util.hash_array(np.array([str(col)], dtype=object))[0]
+            contributions = np.append(_mix64(hashes ^ name_hash), np.uint64(0))
+            totals += contributions[codes]   # code -1 (missing) picks the trailing zero
+    return totals
+
+
+def count_duplicate_rows(hash_arrays):
+    """Rows that repeat an earlier row anywhere in the given files (df.duplicated().sum() semantics)"""
+    hashes = np.concatenate(hash_arrays) if hash_arrays else np.empty(0, dtype=np.uint64)
+    return int(len(hashes) - len(np.unique(hashes)))
+
+
+def cross_file_keep_masks(hash_arrays):
+    """Per-file masks that drop rows already present in an earlier file (duplicates within a file are kept)"""
+    masks = []
+    seen = np.empty(0, dtype=np.uint64)
+    for hashes in hash_arrays:
+        masks.append(~np.isin(hashes, seen, assume_unique=False))
+        seen = np.union1d(seen, hashes)
+    return masks
+
+
+def _bit_length(values):
+    """Vectorised int.bit_length() for uint64 arrays (each 32-bit half is exact in float64)"""
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(high > 0, 32 + np.frexp(high)[1], np.frexp(low)[1])
+
+
+def hll_sketch(hashes, precision=HLL_PRECISION):
+    """HyperLogLog registers for an array of 64-bit hashes; sketches merge with np.maximum"""
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    registers = np.zeros(2 ** precision, dtype=np.uint8)
+    buckets = (hashes >> np.uint64(64 - precision)).astype(np.intp)
+    remainder = hashes << np.uint64(precision)
+    # Position of the first set bit after the bucket bits (all-zero remainders get the maximum)
+    ranks = np.minimum(64 - _bit_length(remainder) + 1, 64 - precision + 1).astype(np.uint8)
+    np.maximum.at(registers, buckets, ranks)
+    return registers
+
+
+def hll_estimate(registers):
+    """Cardinality estimate from HyperLogLog registers, with linear counting for small sets"""
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.exp2(-registers.astype(np.float64)))
+    zeros = np.count_nonzero(registers == 0)
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * np.log(m / zeros)
+    return int(round(estimate))
+
+
+def distinct_count(stats, rows, approx_min_rows=APPROX_DISTINCT_MIN_ROWS):
+    """Distinct values of a profiled column as (count, approximate)
+
+    Sketches are used above approx_min_rows, and for any column whose exact hashes
+    were dropped for exceeding PROFILE_EXACT_DISTINCT_MAX.
+    """
+    if stats['distinct'] is not None and rows <= approx_min_rows:
+        return len(stats['distinct']), False
+    return hll_estimate(stats['hll']), True
+
+
+def profile_frame(df, ipv4_columns=()):
+    """Per-column counts, moments, extremes and distinct-value hashes of one file (see merge_profiles)"""
+    rng = np.random.default_rng(0)
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        nulls = int(series.isna().sum())
+        hashes = _distinct_hashes(series, col in ipv4_columns)
+        stats = {
+            'count': len(series) - nulls,
+            'nulls': nulls,
+            'distinct': hashes if len(hashes) <= PROFILE_EXACT_DISTINCT_MAX else None,
+            'hll': hll_sketch(hashes),
+        }
+        is_number = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+        if is_number and col not in ipv4_columns:
+            values = series.dropna().to_numpy(dtype=np.float64)
+            # Running statistics as (count, mean, M2), merged exactly by merge_moments
+            stats['mean'] = float(values.mean()) if len(values) else 0.0
+            stats['m2'] = float(np.square(values - stats['mean']).sum())
+            if len(values):
+                stats['min'], stats['max'] = float(values.min()), float(values.max())
+            # A uniform sample stands in for the column when merging quantiles
+            if len(values) > PROFILE_SAMPLE_ROWS:
+                values = rng.choice(values, PROFILE_SAMPLE_ROWS, replace=False)
+            stats['sample'] = values
+            stats['sample_weights'] = np.full(len(values), stats['count'] / max(len(values), 1))
+        elif pd.api.types.is_datetime64_any_dtype(series) and stats['count']:
+            stats['min'], stats['max'] = series.min(), series.max()
+        elif col not in ipv4_columns and is_ip_column(series):
+            # IPv6 or mixed address columns are parsed once here, in factorize order (see column_ip_values)
+            stats['ip'] = parse_ip_values(pd.factorize(series)[1])
+        columns[col] = stats
+    numeric = [col for col, stats in columns.items() if 'mean' in stats]
+    shift = np.array([columns[col]['mean'] for col in numeric])
+    return {'rows': len(df), 'columns': columns, 'comoments': frame_comoments(df, numeric, shift)}
+
+
+def frame_comoments(df, columns, shift, chunk_rows=PROFILE_COMOMENT_CHUNK_ROWS):
+    """Pairwise-complete co-moments of numeric columns about shift (see merge_comoments)
+
+    For every pair (i, j) of columns, over the rows where both are present: the row
+    count n, the sums s[i, j] and sums of squares ss[i, j] of column i, and the cross
+    products q[i, j], all of values minus shift. Each chunk takes one Gram-matrix
+    product of [values, squares, presence].
+    """
+    p = len(columns)
+    gram = np.zeros((3 * p, 3 * p))
+    for start in range(0, len(df), chunk_rows):
+        values = np.column_stack([
+            df[col].iloc[start:start + chunk_rows].to_numpy(dtype=np.float64, na_value=np.nan) for col in columns
+        ]) if p else np.empty((min(chunk_rows, len(df) - start), 0))
+        present = ~np.isnan(values)
+        values = np.where(present, values - shift, 0.0)
+        block = np.hstack([values, values ** 2, present])
+        gram += block.T @ block
+    return {
+        'columns': list(columns),
+        'shift': np.asarray(shift, dtype=np.float64),
+        'n': gram[2 * p:, 2 * p:],
+        's': gram[:p, 2 * p:],
+        'ss': gram[p:2 * p, 2 * p:],
+        'q': gram[:p, :p],
+    }
+
+
+def merge_moments(parts):
+    """Combine (count, mean, M2) statistics of disjoint parts with Chan's pairwise update, as (mean, M2)"""
+    count, mean, m2 = 0, 0.0, 0.0
+    for part in parts:
+        n = part['count']
+        if not n:
+            continue
+        total = count + n
+        delta = part['mean'] - mean
+        mean += delta * n / total
+        m2 += part['m2'] + delta ** 2 * count * n / total
+        count = total
+    return mean, m2
+
+
+def merge_comoments(parts, columns, shift):
+    """Co-moments of the concatenation of several files about a common shift (e.g. the merged means)
+
+    Columns a file lacks are missing on all its rows, so it adds nothing to their pairs;
+    columns of a file that are not in columns are dropped.
+    """
+    index = {col: i for i, col in enumerate(columns)}
+    p = len(columns)
+    merged = {key: np.zeros((p, p)) for key in ('n', 's', 'ss', 'q')}
+    for part in parts:
+        keep = np.array([col in index for col in part['columns']], dtype=bool)
+        if not keep.any():
+            continue
+        at = np.array([index[col] for col in part['columns'] if col in index], dtype=np.intp)
+        n, s, ss, q = (part[key][np.ix_(keep, keep)] for key in ('n', 's', 'ss', 'q'))
+        # Re-centre: x - shift = (x - part shift) + d
+        d = part['shift'][keep] - np.asarray(shift)[at]
+        cell = np.ix_(at, at)
+        merged['n'][cell] += n
+        merged['s'][cell] += s + n * d[:, None]
+        merged['ss'][cell] += ss + 2 * d[:, None] * s + n * d[:, None] ** 2
+        merged['q'][cell] += q + d[None, :] * s + d[:, None] * s.T + n * np.outer(d, d)
+    return {'columns': list(columns), 'shift': np.asarray(shift, dtype=np.float64), **merged}
+
+
+def comoment_correlation(comoments, columns=None):
+    """Pearson correlation matrix (pairwise-complete, like DataFrame.corr) from co-moments"""
+    n, s, ss, q = comoments['n'], comoments['s'], comoments['ss'], comoments['q']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_i, mean_j = s / n, s.T / n
+        cov = q / n - mean_i * mean_j
+        var_i = np.maximum(ss / n - mean_i ** 2, 0.0)
+        corr = np.clip(cov / np.sqrt(var_i * var_i.T), -1.0, 1.0)
+    corr = pd.DataFrame(corr, index=comoments['columns'], columns=comoments['columns'])
+    return corr if columns is None else corr.loc[list(columns), list(columns)]
+
+
+def strong_correlations(corr, threshold=0.5):
+    """(column, column, r) for each pair above threshold in absolute value, from the upper triangle"""
+    values = corr.to_numpy()
+    rows, cols = np.nonzero(np.triu(np.abs(values) > threshold, k=1))
+    return [(corr.columns[i], corr.columns[j], values[i, j]) for i, j in zip(rows, cols)]
+
+
+def remove_moments(total, part):
+    """Inverse of merge_moments: the (mean, M2) of total once the disjoint part is taken out of it"""
+    count = total['count'] - part['count']
+    if count <= 0:
+        return 0.0, 0.0
+    mean = (total['count'] * total['mean'] - part['count'] * part['mean']) / count
+    delta = part['mean'] - mean
+    m2 = total['m2'] - part['m2'] - delta ** 2 * count * part['count'] / total['count']
+    return mean, max(m2, 0.0)
+
+
+def merge_profiles(profiles):
+    """Profile of the concatenation of several files, computed from their profiles alone"""
+    if len(profiles) == 1:
+        return profiles[0]
+    names = dict.fromkeys(col for profile in profiles for col in profile['columns'])
+    columns = {}
+    for col in names:
+        parts = [profile['columns'][col] for profile in profiles if col in profile['columns']]
+        # Rows of files without the column are missing values once the files are concatenated
+        absent_rows = sum(profile['rows'] for profile in profiles if col not in profile['columns'])
+        merged = {
+            'count': sum(part['count'] for part in parts),
+            'nulls': sum(part['nulls'] for part in parts) + absent_rows,
+            'hll': functools.reduce(np.maximum, [part['hll'] for part in parts]),
+        }
+        exact = [part['distinct'] for part in parts]
+        merged['distinct'] = None if any(d is None for d in exact) else functools.reduce(np.union1d, exact)
+        if merged['distinct'] is not None and len(merged['distinct']) > PROFILE_EXACT_DISTINCT_MAX:
+            merged['distinct'] = None
+        if all('mean' in part for part in parts):
+            merged['mean'], merged['m2'] = merge_moments(parts)
+            for key in ('sample', 'sample_weights'):
+                merged[key] = np.concatenate([part[key] for part in parts])
+        extremes = [part for part in parts if 'min' in part]
+        if extremes and len({type(part['min']) for part in extremes}) == 1:
+            merged['min'] = min(part['min'] for part in extremes)
+            merged['max'] = max(part['max'] for part in extremes)
+        columns[col] = merged
+    numeric = [col for col, stats in columns.items() if 'mean' in stats]
+    comoments = merge_comoments([profile['comoments'] for profile in profiles], numeric,
+                                [columns[col]['mean'] for col in numeric])
+    return {'rows': sum(profile['rows'] for profile in profiles), 'columns': columns, 'comoments': comoments}
+
+
+def column_summary(profile, dtypes, approx_min_rows=APPROX_DISTINCT_MIN_ROWS):
+    """Column Details table (type, distinct and missing counts) for the columns in dtypes
+
+    Unique Values are formatted counts, prefixed with ~ where they are estimates.
+    """
+    stats = [profile['columns'][col] for col in dtypes.index]
+    nulls = np.array([s['nulls'] for s in stats], dtype=np.int64)
+    distinct = [distinct_count(s, profile['rows'], approx_min_rows) for s in stats]
+    return pd.DataFrame({
+        'Column': dtypes.index,
+        'Type': dtypes.values,
+        'Unique Values': [f"~{count:,}" if approximate else f"{count:,}" for count, approximate in distinct],
+        'Missing Values': nulls,
+        '% Missing': nulls / max(profile['rows'], 1) * 100
+    })
+
+
+def _weighted_quantiles(values, weights, quantiles):
+    order = np.argsort(values)
+    values, cumulative = values[order], np.cumsum(weights[order])
+    positions = np.searchsorted(cumulative, np.asarray(quantiles) * cumulative[-1], side='left')
+    return values[np.minimum(positions, len(values) - 1)]
+
+
+def profile_moments(stats):
+    """Mean and sample standard deviation of a profiled numeric column (NaN when undefined)"""
+    n = stats['count']
+    mean = stats['mean'] if n else np.nan
+    return mean, np.sqrt(stats['m2'] / (n - 1)) if n > 1 else np.nan
+
+
+def numeric_summary(profile, columns):
+    """describe()-style statistics rebuilt from a profile; quantiles come from the column samples"""
+    labels = [f'{q:.0%}' for q in PROFILE_QUANTILES]
+    rows = []
+    for col in columns:
+        s = profile['columns'][col]
+        mean, std = profile_moments(s)
+        if len(s['sample']):
+            quantiles = _weighted_quantiles(s['sample'], s['sample_weights'], PROFILE_QUANTILES)
+        else:
+            quantiles = [np.nan] * len(labels)
+        rows.append([s['count'], mean, std, s.get('min', np.nan), *quantiles, s.get('max', np.nan)])
+    return pd.DataFrame(rows, index=list(columns), columns=['count', 'mean', 'std', 'min', *labels, 'max'])
+
+
+def score_anomalies(df, columns, threshold, method='zscore', moments=None):
+    """Score all numeric columns in one vectorised pass and keep the rows beyond threshold
+
+    'zscore' centres on the mean and scales by the standard deviation (taken from
+    moments, {column: (mean, std)}, when given); 'mad' uses the median and the scaled
+    median absolute deviation, which the outliers themselves cannot inflate. The frame
+    is never modified. Returns ({column: scores of flagged rows, indexed by row position
+    and ordered by decreasing |score|}, summary table).
+    """
+    values = df[columns].to_numpy(dtype=np.float64, na_value=np.nan)
+    if method == 'mad':
+        center = np.nanmedian(values, axis=0)
+        scale = MAD_SCALE * np.nanmedian(np.abs(values - center), axis=0)
+    elif moments is not None:
+        center, scale = (np.array(part, dtype=np.float64) for part in zip(*(moments[col] for col in columns)))
+    else:
+        center, scale = np.nanmean(values, axis=0), np.nanstd(values, axis=0, ddof=1)
+    scale = np.where(scale > 0, scale, np.nan)
+    
+    scores = (values - center) / scale
+    with np.errstate(invalid='ignore'):
+        flagged = np.abs(scores) > threshold
+    hits = {}
+    for i, col in enumerate(columns):
+        rows = np.flatnonzero(flagged[:, i])
+        col_scores = scores[rows, i]
+        order = np.argsort(-np.abs(col_scores), kind='stable')
+        hits[col] = pd.Series(col_scores[order], index=rows[order], name='z_score')
+    summary = pd.DataFrame({
+        'Column': columns,
+        'Center': center,
+        'Scale': scale,
+        'Anomalies': [len(hits[col]) for col in columns],
+        'Max |Score|': [hits[col].abs().max() if len(hits[col]) else np.nan for col in columns],
+    })
+    return hits, summary
+
+
+def ledoit_wolf(X):
+    """Ledoit-Wolf shrunk covariance of centred rows X, as (covariance, shrinkage towards a scaled identity)"""
+    n, p = X.shape
+    cov = X.T @ X / n
+    mu = np.trace(cov) / p
+    X2 = X ** 2
+    beta = (np.sum(X2.T @ X2) / n - np.sum(cov ** 2)) / (n * p)
+    delta = (np.sum(cov ** 2) - 2 * mu * np.trace(cov) + p * mu ** 2) / p
+    shrinkage = min(beta, delta) / delta if delta > 0 else 1.0
+    return (1 - shrinkage) * cov + shrinkage * mu * np.eye(p), shrinkage
+
+
+def fit_mahalanobis(df, columns, sample_rows=MULTIVARIATE_SAMPLE_ROWS, seed=0):
+    """Centre, scale and shrunk precision matrix of numeric columns, fitted on a uniform row sample"""
+    rows = len(df)
+    if rows > sample_rows:
+        positions = np.sort(np.random.default_rng(seed).choice(rows, sample_rows, replace=False))
+        sample = df[columns].iloc[positions]
+    else:
+        sample = df[columns]
+    values = sample.to_numpy(dtype=np.float64, na_value=np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)   # all-missing columns
+        center = np.nan_to_num(np.nanmean(values, axis=0))
+        scale = np.nanstd(values, axis=0)
+    scale = np.where(scale > 0, scale, 1.0)
+    # Missing values sit at the centre, so they add nothing to a row's distance
+    X = np.nan_to_num((values - center) / scale)
+    cov, shrinkage = ledoit_wolf(X)
+    return {
+        'columns': list(columns),
+        'center': center,
+        'scale': scale,
+        'precision': np.linalg.pinv(cov),
+        'shrinkage': shrinkage,
+        'sample_rows': len(values),
+    }
+
+
+def chi2_cutoff(dof, sigmas):
+    """Wilson-Hilferty approximation of the chi-square(dof) quantile as rare as a one-sided sigmas-σ deviation"""
+    return dof * (1 - 2 / (9 * dof) + sigmas * np.sqrt(2 / (9 * dof))) ** 3
+
+
+def mahalanobis_anomalies(df, columns, threshold, chunk_rows=MULTIVARIATE_CHUNK_ROWS, model=None):
+    """Rows whose combination of numeric values is unusual, scored chunk by chunk against a sampled fit
+
+    A row is flagged when its squared Mahalanobis distance under the shrunk
+    covariance is as rare for multivariate normal data as a threshold-σ deviation
+    is for one column. Returns (frame of distance and the column contributing most,
+    indexed by row position and ordered by decreasing distance, model).
+    """
+    model = model or fit_mahalanobis(df, columns)
+    cutoff = chi2_cutoff(len(columns), threshold)
+    model['cutoff'] = float(np.sqrt(cutoff))
+    positions, distances, drivers = [], [], []
+    for start in range(0, len(df), chunk_rows):
+        values = df[columns].iloc[start:start + chunk_rows].to_numpy(dtype=np.float64, na_value=np.nan)
+        X = np.nan_to_num((values - model['center']) / model['scale'])
+        # Per-column terms of x' P x: they sum to the squared distance and show what drove it
+        terms = X * (X @ model['precision'])
+        squared = terms.sum(axis=1)
+        flagged = np.flatnonzero(squared > cutoff)
+        positions.append(flagged + start)
+        distances.append(np.sqrt(squared[flagged]))
+        drivers.append(terms[flagged].argmax(axis=1))
+    positions, distances = np.concatenate(positions), np.concatenate(distances)
+    order = np.argsort(-distances, kind='stable')
+    hits = pd.DataFrame({
+        'distance': distances[order],
+        'main_driver': np.asarray(columns, dtype=object)[np.concatenate(drivers)[order]],
+    }, index=positions[order])
+    return hits, model
+
+
+def build_entity_index(df, entity_col, time_col, freq, numeric_cols=(), packed_ipv4=False):
+    """Event counts and numeric sums (and sums of squares) per (entity, time bucket), in factorised sparse arrays
+
+    Entities are factor codes into 'labels'; buckets count freq steps from 'start'. Only
+    the (entity, bucket) pairs that occur are stored, sorted by entity then bucket.
+    """
+    codes, uniques = pd.factorize(df[entity_col])
+    labels = unpack_ipv4(uniques) if packed_ipv4 else pd.Series(np.asarray(uniques, dtype=object)).astype(str)
+    times = df[time_col]
+    step = pd.Timedelta(freq)
+    start = times.min().floor(freq)
+    buckets = ((times - start) // step).to_numpy(dtype=np.int64, na_value=-1)
+    valid = (codes >= 0) & (buckets >= 0)
+    n_buckets = int(buckets.max()) + 1 if valid.any() else 1
+    
+    keys, inverse = np.unique(codes[valid].astype(np.int64) * n_buckets + buckets[valid], return_inverse=True)
+    sums, sumsq = {}, {}
+    for col in numeric_cols:
+        values = np.nan_to_num(df[col].to_numpy(dtype=np.float64, na_value=np.nan)[valid])
+        sums[col] = np.bincount(inverse, weights=values, minlength=len(keys))
+        sumsq[col] = np.bincount(inverse, weights=values ** 2, minlength=len(keys))
+    return {
+        'entity_col': entity_col,
+        'labels': labels.to_numpy(dtype=object),
+        'start': start,
+        'freq': freq,
+        'n_buckets': n_buckets,
+        'entity': keys // n_buckets,
+        'bucket': keys % n_buckets,
+        'count': np.bincount(inverse, minlength=len(keys)),
+        'sums': sums,
+        'sumsq': sumsq,
+    }
+
+
+def score_entities(index, metric=None, top_k=ENTITY_TOP_K, min_buckets=ENTITY_MIN_BUCKETS):
+    """Each entity's busiest bucket scored against its own baseline, for all entities at once
+
+    metric is None for event counts or a numeric column (summed per bucket). The
+    baseline is the entity's mean and standard deviation over every other bucket since
+    it was first seen (empty buckets count as zero). The spread is floored at the noise
+    of a Poisson stream of the entity's events: sqrt(events per bucket) for counts, and
+    that times the root mean square event value for sums, so one large event from a
+    quiet entity is not a burst. Entities active in fewer than min_buckets buckets are
+    not scored. Returns the top_k entities by score.
+    """
+    counts = index['count'].astype(np.float64)
+    values = counts if metric is None else index['sums'][metric]
+    entity, bucket = index['entity'], index['bucket']
+    if not len(entity):
+        return pd.DataFrame(columns=['Entity', 'Events', 'Active Buckets', 'Baseline', 'Peak', 'Peak Time', 'Ratio', 'Score'])
+    starts = np.flatnonzero(np.r_[True, entity[1:] != entity[:-1]])
+    active = np.diff(np.r_[starts, len(entity)])
+    span = index['n_buckets'] - bucket[starts]
+    events = np.add.reduceat(counts, starts)
+    total = np.add.reduceat(values, starts)
+    total_sq = np.add.reduceat(values ** 2, starts)
+    # Rows are sorted by entity, so the first row of each entity after ordering by value is its peak
+    peak_rows = np.lexsort((-values, entity))[starts]
+    peak = values[peak_rows]
+    
+    # Leave the peak bucket out of the baseline it is compared with
+    others = np.maximum(span - 1, 1)
+    mean = (total - peak) / others
+    variance = (total_sq - peak ** 2 - others * mean ** 2) / np.maximum(others - 1, 1)
+    rate = (events - counts[peak_rows]) / others
+    event_square = 1.0 if metric is None else np.add.reduceat(index['sumsq'][metric], starts) / events
+    floor = np.sqrt(np.maximum(rate, 1.0) * event_square)
+    scale = np.maximum(np.sqrt(np.maximum(variance, 0)), floor)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = np.where(active >= min_buckets, (peak - mean) / scale, np.nan)
+    
+    top = np.argsort(-np.nan_to_num(score, nan=-np.inf), kind='stable')[:top_k]
+    top = top[~np.isnan(score[top])]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = peak[top] / mean[top]
+    return pd.DataFrame({
+        'Entity': index['labels'][entity[starts[top]]],
+        'Events': np.add.reduceat(index['count'], starts)[top],
+        'Active Buckets': active[top],
+        'Baseline': mean[top],
+        'Peak': peak[top],
+        'Peak Time': index['start'] + bucket[peak_rows[top]] * pd.Timedelta(index['freq']),
+        'Ratio': np.where(np.isfinite(ratio), ratio, np.nan),
+        'Score': score[top],
+    })
+
+
+def minmax_downsample(values, buckets=PLOT_MAX_BUCKETS):
+    """Positions of the smallest and largest value in each of `buckets` equal runs of points
+
+    Keeps at most 2 x buckets points whatever the length, and every spike or dip
+    survives, unlike striding or averaging. Missing values are never picked.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if n <= 2 * buckets:
+        return np.arange(n)
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = values
+    padded = padded.reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    lows = np.where(np.isnan(padded), np.inf, padded).argmin(axis=1) + offsets
+    highs = np.where(np.isnan(padded), -np.inf, padded).argmax(axis=1) + offsets
+    positions = np.unique(np.concatenate([lows, highs]))
+    positions = positions[positions < n]
+    return positions[~np.isnan(values[positions])]
+
+
+def distribution_summary(series):
+    """Histogram, box statistics, KDE and ECDF points of a numeric column, of a fixed size whatever its length
+
+    One sort of the finite values serves every view: bin counts and fences are
+    searchsorted positions, the KDE is a Gaussian kernel convolved over a binned grid
+    (Silverman bandwidth), and the ECDF is sampled at evenly spaced probabilities.
+    Only the most extreme outliers are kept. Returns None for a column without values.
+    """
+    values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    values = np.sort(values[np.isfinite(values)])
+    n = len(values)
+    if not n:
+        return None
+    
+    edges = np.histogram_bin_edges(values, bins='auto')
+    if len(edges) - 1 > DISTRIBUTION_MAX_BINS:
+        edges = np.linspace(values[0], values[-1], DISTRIBUTION_MAX_BINS + 1)
+    positions = np.searchsorted(values, edges, side='left')
+    positions[-1] = n
+    
+    q1, median, q3 = np.quantile(values, [0.25, 0.5, 0.75])
+    low, high = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+    # Whiskers end at the most extreme values inside the 1.5 x IQR fences
+    first = np.searchsorted(values, low, side='left')
+    last = np.searchsorted(values, high, side='right') - 1
+    outliers = np.concatenate([values[:first][:DISTRIBUTION_MAX_OUTLIERS // 2],
+                               values[last + 1:][-(DISTRIBUTION_MAX_OUTLIERS // 2):]])
+    
+    std = values.std(ddof=1) if n > 1 else 0.0
+    spread = min(std, (q3 - q1) / 1.34) or std or 1.0
+    bandwidth = 1.06 * spread * n ** -0.2
+    grid = np.linspace(values[0] - 4 * bandwidth, values[-1] + 4 * bandwidth, DISTRIBUTION_GRID_POINTS)
+    step = grid[1] - grid[0]
+    binned = np.diff(np.searchsorted(values, np.r_[grid - step / 2, grid[-1] + step / 2]))
+    reach = min(int(np.ceil(4 * bandwidth / step)), (DISTRIBUTION_GRID_POINTS - 1) // 2)
+    kernel = np.exp(-0.5 * (np.arange(-reach, reach + 1) * step / bandwidth) ** 2) / np.sqrt(2 * np.pi)
+    density = np.convolve(binned, kernel, mode='same') / (n * bandwidth)
+    
+    probabilities = np.linspace(0, 1, min(DISTRIBUTION_ECDF_POINTS, n))
+    return {
+        'rows': n,
+        'edges': edges,
+        'counts': np.diff(positions),
+        'q1': q1, 'median': median, 'q3': q3,
+        'lowerfence': values[first] if first <= last else q1,
+        'upperfence': values[last] if first <= last else q3,
+        'mean': values.mean(), 'std': std,
+        'outliers': outliers,
+        'grid': grid, 'density': density,
+        'ecdf_x': values[np.round(probabilities * (n - 1)).astype(np.int64)],
+        'ecdf_y': probabilities,
+    }
+
+
+def build_rollup(df, time_col, numeric_cols=(), split_col=None):
+    """Event counts and per-column non-null counts, sums and sums of squares per minute, hour and day
+
+    Rows are keyed by minute (and split_col value, when given, with missing values as
+    None) and aggregated in one sort; the hourly and daily levels are re-aggregated
+    from the minute level. Returns {level: frame with 'time' and optional 'split'
+    columns}, see rollup_series.
+    """
+    minutes = df[time_col].to_numpy(dtype='datetime64[ns]').astype('datetime64[m]')
+    valid = ~np.isnat(minutes)
+    keys = minutes.astype(np.int64)[valid]
+    if split_col is not None:
+        codes, labels = pd.factorize(df[split_col])
+        width = len(labels) + 1
+        keys = keys * width + (codes[valid] + 1)
+    keys, inverse = np.unique(keys, return_inverse=True)
+    
+    columns = {}
+    if split_col is not None:
+        columns['time'] = pd.to_datetime(keys // width, unit='m')
+        columns['split'] = np.append(np.asarray(labels, dtype=object), None)[keys % width - 1]
+    else:
+        columns['time'] = pd.to_datetime(keys, unit='m')
+    columns['count'] = np.bincount(inverse, minlength=len(keys))
+    for col in numeric_cols:
+        values = df[col].to_numpy(dtype=np.float64, na_value=np.nan)[valid]
+        present = ~np.isnan(values)
+        values = np.where(present, values, 0.0)
+        columns[f'n:{col}'] = np.bincount(inverse, weights=present, minlength=len(keys)).astype(np.int64)
+        columns[f'sum:{col}'] = np.bincount(inverse, weights=values, minlength=len(keys))
+        columns[f'sumsq:{col}'] = np.bincount(inverse, weights=values ** 2, minlength=len(keys))
+    
+    rollup = {'min': pd.DataFrame(columns)}
+    group_cols = ['time', 'split'] if split_col is not None else ['time']
+    for level in ROLLUP_LEVELS[1:]:
+        finer = rollup['min']
+        rollup[level] = finer.assign(time=finer['time'].dt.floor(level)) \
+            .groupby(group_cols, sort=True, dropna=False).sum().reset_index()
+    return rollup
+
+
+def rollup_level(freq):
+    """Coarsest rollup level whose buckets nest inside buckets of freq"""
+    offset = pd.tseries.frequencies.to_offset(freq)
+    if not isinstance(offset, pd.offsets.Tick):
+        return 'D'   # calendar frequencies (weeks, months) are whole days
+    step = pd.Timedelta(offset)
+    for level in reversed(ROLLUP_LEVELS):
+        if not step % pd.Timedelta(1, unit=level):
+            return level
+    raise ValueError(f"Rollups cannot serve buckets finer than a minute ({freq})")
+
+
+def rollup_series(rollup, freq, columns=()):
+    """resample(freq)-style frame from a rollup: event 'count' and the mean of each column per bucket
+
+    Empty buckets are included (count 0, NaN means), like resampling the raw rows.
+    """
+    level = rollup[rollup_level(freq)]
+    totals = level.drop(columns='split', errors='ignore').groupby('time').sum().resample(freq).sum()
+    result = pd.DataFrame({'count': totals['count']})
+    for col in columns:
+        result[col] = totals[f'sum:{col}'] / totals[f'n:{col}'].where(totals[f'n:{col}'] > 0)
+    return result
+
+
+def seasonal_scores(series, period='week', window=SEASONAL_WINDOW, min_points=SEASONAL_MIN_POINTS):
+    """Robust scores of a resampled series against rolling hour-of-week (or hour-of-day) baselines
+
+    The buckets are laid out as a (periods x hours x buckets per hour) array, so the
+    baseline of every hour - median and scaled MAD of that hour's buckets over the
+    current and previous window - 1 periods - is computed for all buckets at once.
+    Buckets must evenly divide an hour. Returns a frame of value, baseline, scale and
+    score per bucket (NaN until the baseline has min_points buckets from at least two periods).
+    """
+    if series.empty:
+        raise ValueError("There are no time buckets to score")
+    freq = series.index.freq
+    hour = pd.Timedelta(hours=1)
+    # Week (and, since pandas 3, day) offsets are calendar-relative rather than Ticks and have no Timedelta
+    if not isinstance(freq, pd.tseries.offsets.Tick) or pd.Timedelta(freq) > hour:
+        raise ValueError("Seasonal baselines need buckets of one hour or less that divide an hour")
+    step = pd.Timedelta(freq)
+    if hour % step:
+        raise ValueError("Seasonal baselines need buckets of one hour or less that divide an hour")
+    per_hour = hour // step
+    hours = 168 if period == 'week' else 24
+    start = series.index[0].floor('D')
+    if period == 'week':
+        start -= pd.Timedelta(days=start.dayofweek)
+    positions = ((series.index - start) // step).to_numpy()
+    n_periods = positions[-1] // (hours * per_hour) + 1
+    values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    
+    grid = np.full((n_periods + window - 1) * hours * per_hour, np.nan)
+    grid[(window - 1) * hours * per_hour + positions] = values
+    grid = grid.reshape(n_periods + window - 1, hours, per_hour)
+    # (periods, hours, window, per_hour) -> every bucket of an hour over the window, per period
+    windows = np.lib.stride_tricks.sliding_window_view(grid, window, axis=0)
+    windows = windows.reshape(n_periods, hours, per_hour * window)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)   # hours without data have all-NaN windows
+        baseline = np.nanmedian(windows, axis=-1)
+        scale = MAD_SCALE * np.nanmedian(np.abs(windows - baseline[..., None]), axis=-1)
+    # A baseline is trusted once its window spans two periods with data and at least
+    # two periods' worth of buckets, so an hour is never scored against itself alone
+    points = np.count_nonzero(~np.isnan(windows), axis=-1)
+    hour_seen = ~np.isnan(grid).all(axis=-1)
+    periods = np.lib.stride_tricks.sliding_window_view(hour_seen, window, axis=0).sum(axis=-1)
+    baseline[(points < max(min_points, 2 * per_hour)) | (periods < 2)] = np.nan
+    
+    slots = positions // per_hour
+    baseline = baseline.reshape(-1)[slots]
+    scale = scale.reshape(-1)[slots]
+    # The MAD of one hour's few buckets is often far too small; the robust spread of
+    # all residuals (seasonality already removed) floors it
+    residuals = np.abs(values - baseline)
+    if not np.isnan(residuals).all():
+        scale = np.maximum(scale, SEASONAL_SCALE_FLOOR * MAD_SCALE * np.nanmedian(residuals))
+    scale = np.where(scale > 0, scale, np.nan)
+    return pd.DataFrame({
+        'value': values,
+        'baseline': baseline,
+        'scale': scale,
+        'score': (values - baseline) / scale,
+    }, index=series.index)
+
+
+def ruleset_version(patterns):
+    """Short digest of a signature set, so cached scan results are dropped when the rules change"""
+    return hashlib.sha256(json.dumps(patterns).encode()).hexdigest()[:12]
+
+
+def signature_mask_dtype(patterns):
+    """Smallest unsigned integer dtype with a bit for every pattern"""
+    if len(patterns) > 64:
+        raise ValueError("At most 64 patterns fit in a signature mask")
+    return next(np.dtype(dtype) for dtype in (np.uint8, np.uint16, np.uint32, np.uint64)
+                if len(patterns) <= 8 * np.dtype(dtype).itemsize)
+
+
+def match_unique_values(values, patterns=THREAT_PATTERNS):
+    """Signature bitmask (bit i = i-th pattern) of each value in an array of distinct values
+
+    All values are scanned once with the alternation of all patterns; only the values
+    that hit are re-tested per pattern to find which signatures they carry. Masks use
+    the smallest unsigned dtype that fits the patterns. Also the process-pool entry
+    point for sharded scans.
+    """
+    dtype = signature_mask_dtype(patterns)
+    values = pd.Series(np.asarray(values, dtype=object)).astype(str)
+    combined = '|'.join(f'(?:{pattern})' for pattern in patterns.values())
+    candidates = values[values.str.contains(combined, case=False, regex=True).to_numpy(dtype=bool)]
+    masks = np.zeros(len(values), dtype=dtype)
+    for bit, pattern in enumerate(patterns.values()):
+        hits = candidates.index[candidates.str.contains(pattern, case=False, regex=True).to_numpy(dtype=bool)]
+        masks[hits] |= dtype.type(1 << bit)
+    return masks
+
+
+def broadcast_masks(codes, unique_masks):
+    """Expand per-distinct-value masks to rows through factor codes (missing values match nothing)"""
+    return np.append(unique_masks, unique_masks.dtype.type(0))[codes]
+
+
+def match_signatures(series, patterns=THREAT_PATTERNS):
+    """Per-row uint64 bitmask of the patterns each value of a text column matches"""
+    codes, uniques = pd.factorize(series)
+    return broadcast_masks(codes, match_unique_values(np.asarray(uniques, dtype=object), patterns))
+
+
+def signature_counts(masks, names):
+    """Rows matching each signature of a mask from match_signatures, keyed by signature name"""
+    return {name: int(np.count_nonzero(masks & np.uint64(1 << bit))) for bit, name in enumerate(names)}
+
+
+def _rule_field(name):
+    """Rule field names are cleaned like upload column names, so 'Source IP' targets sourceip"""
+    return re.sub(r'[^a-zA-Z0-9_]', '', str(name)).lower()
+
+
+def _rule_text(value):
+    """Text a rule value is compared as; integral numbers lose their '.0' so 22 and 22.0 both match '22'"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _rule_clause(key, values, source):
+    """One detection entry ('field|modifier|all': value or list) as (field, op, values, match_all)"""
+    field, *modifiers = str(key).split('|')
+    unknown = [m for m in modifiers if m not in RULE_MODIFIERS + ('all',)]
+    if unknown:
+        raise ValueError(f"{source}: unsupported modifier '{unknown[0]}' in '{key}'")
+    op = next((m for m in modifiers if m in RULE_MODIFIERS), 'equals')
+    values = values if isinstance(values, list) else [values]
+    if not values:
+        raise ValueError(f"{source}: '{key}' has an empty value list")
+    values = tuple(_rule_text(v) for v in values)
+    if op == 're':
+        for pattern in values:
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f"{source}: invalid regex for '{key}': {e}")
+    else:
+        values = tuple(v.lower() for v in values)
+    return (_rule_field(field), op, values, 'all' in modifiers)
+
+
+def _parse_condition(text, selections, source):
+    """Parse a Sigma condition into a tree of ('sel', name), ('not', node), ('and'|'or', [nodes])
+
+    Supports and, or, not, parentheses and '1 of' / 'all of' a selection name, a
+    wildcard pattern or 'them'.
+    """
+    tokens = RULE_CONDITION_TOKENS.findall(str(text))
+    position = 0
+    
+    def peek():
+        return tokens[position].lower() if position < len(tokens) else None
+    
+    def take():
+        nonlocal position
+        if position >= len(tokens):
+            raise ValueError(f"{source}: condition '{text}' ends unexpectedly")
+        position += 1
+        return tokens[position - 1]
+    
+    def expression():
+        nodes = [term()]
+        while peek() == 'or':
+            take()
+            nodes.append(term())
+        return nodes[0] if len(nodes) == 1 else ('or', nodes)
+    
+    def term():
+        nodes = [factor()]
+        while peek() == 'and':
+            take()
+            nodes.append(factor())
+        return nodes[0] if len(nodes) == 1 else ('and', nodes)
+    
+    def factor():
+        token = take()
+        lowered = token.lower()
+        if lowered == 'not':
+            return ('not', factor())
+        if token == '(':
+            node = expression()
+            if take() != ')':
+                raise ValueError(f"{source}: unbalanced parentheses in condition '{text}'")
+            return node
+        if lowered in ('1', 'all') and peek() == 'of':
+            take()
+            pattern = take()
+            names = list(selections) if pattern.lower() == 'them' else fnmatch.filter(selections, pattern)
+            if not names:
+                raise ValueError(f"{source}: no selection matches '{pattern}' in condition '{text}'")
+            return ('or' if lowered == '1' else 'and', [('sel', name) for name in names])
+        if token not in selections:
+            raise ValueError(f"{source}: unknown selection '{token}' in condition '{text}'")
+        return ('sel', token)
+    
+    tree = expression()
+    if position != len(tokens):
+        raise ValueError(f"{source}: unexpected '{tokens[position]}' in condition '{text}'")
+    return tree
+
+
+def _normalise_rule(raw, source, index):
+    if not isinstance(raw, dict) or not isinstance(raw.get('detection'), dict):
+        raise ValueError(f"{source}: rule {index + 1} has no detection mapping")
+    title = str(raw.get('title') or raw.get('id') or f"{source} #{index + 1}")
+    selections = {}
+    for name, selection in raw['detection'].items():
+        if name == 'condition':
+            continue
+        if name == 'keywords' or isinstance(selection, list):
+            # Keyword lists match when any text column contains any of them
+            if not selection:
+                raise ValueError(f"{source}: '{name}' has an empty keyword list")
+            selections[name] = [(None, 'contains', tuple(_rule_text(v).lower() for v in selection), False)]
+        elif isinstance(selection, dict):
+            selections[name] = [_rule_clause(key, values, source) for key, values in selection.items()]
+        else:
+            selections[name] = [_rule_clause(name, selection, source)]
+        if not selections[name]:
+            raise ValueError(f"{source}: selection '{name}' of rule '{title}' is empty")
+    if not selections:
+        raise ValueError(f"{source}: rule '{title}' has an empty detection")
+    # Without a condition every selection must match (Sigma's 'all of them')
+    condition = raw['detection'].get('condition', 'all of them')
+    if isinstance(condition, list):
+        condition = ' or '.join(f'({c})' for c in condition)
+    return {
+        'id': str(raw.get('id') or title),
+        'title': title,
+        'level': str(raw.get('level', 'medium')),
+        'selections': selections,
+        'condition': _parse_condition(condition, selections, source),
+        'clauses': [clause for clauses in selections.values() for clause in clauses],
+        'source': source,
+    }
+
+
+def load_rule_pack(text, source):
+    """Parse a YAML or JSON rule pack (a list of rules, {'rules': [...]}, or YAML documents) into rules"""
+    if source.endswith('.json'):
+        documents = [json.loads(text)]
+    elif yaml is None:
+        raise ValueError(f"{source}: PyYAML is required for YAML rule packs (pip install pyyaml)")
+    else:
+        documents = [doc for doc in yaml.safe_load_all(text) if doc is not None]
+    raw_rules = []
+    for doc in documents:
+        if isinstance(doc, dict) and 'rules' in doc:
+            raw_rules.extend(doc['rules'])
+        elif isinstance(doc, list):
+            raw_rules.extend(doc)
+        else:
+            raw_rules.append(doc)
+    return [_normalise_rule(raw, source, i) for i, raw in enumerate(raw_rules)]
+
+
+def load_rule_dir(path=RULE_PACKS_DIR):
+    """Rules from every .yml/.yaml/.json pack in a directory, plus (file name, error) for packs that failed"""
+    rules, errors = [], []
+    if not path or not os.path.isdir(path):
+        return rules, errors
+    for name in sorted(os.listdir(path)):
+        if name.endswith(('.yml', '.yaml', '.json')):
+            try:
+                with open(os.path.join(path, name), encoding='utf-8') as f:
+                    rules.extend(load_rule_pack(f.read(), name))
+            except Exception as e:
+                errors.append((name, str(e)))
+    return rules, errors
+
+
+def _required_literal(pattern):
+    """Longest literal run every match of a regex must contain (lowercased), or None"""
+    best, run = '', ''
+    for op, arg in sre_parse.parse(pattern):
+        if op == sre_parse.LITERAL:
+            run += chr(arg)
+            continue
+        best, run = max(best, run, key=len), ''
+    best = max(best, run, key=len)
+    return best.lower() if len(best) >= RULE_LITERAL_MIN_LENGTH else None
+
+
+def _rule_values(uniques):
+    """Lowercased text of distinct column values as rule tests see them (integral numbers without '.0')"""
+    values = np.asarray(uniques)
+    if values.dtype.kind == 'f':
+        integral = np.isfinite(values) & (values == np.round(values)) & (np.abs(values) < 2 ** 53)
+        text = values.astype(str).astype(object)
+        text[integral] = values[integral].astype(np.int64).astype(str)
+        return pd.Series(text)
+    return pd.Series(values.astype(object)).astype(str).str.lower()
+
+
+def _rule_rows(node, selection_rows, universe):
+    """Row positions satisfying a parsed condition, from the rows of each selection"""
+    kind, arg = node
+    if kind == 'sel':
+        return selection_rows[arg]
+    if kind == 'not':
+        return np.setdiff1d(universe, _rule_rows(arg, selection_rows, universe), assume_unique=True)
+    parts = [_rule_rows(child, selection_rows, universe) for child in arg]
+    if kind == 'and':
+        return functools.reduce(lambda a, b: np.intersect1d(a, b, assume_unique=True), parts)
+    return functools.reduce(np.union1d, parts)
+
+
+def _match_atom(values, op, value):
+    """Boolean hits of one test over lowercased distinct values of a column"""
+    if op == 'equals':
+        return (values == value).to_numpy(dtype=bool)
+    if op == 'contains':
+        return values.str.contains(value, regex=False).to_numpy(dtype=bool)
+    if op == 'startswith':
+        return values.str.startswith(value).to_numpy(dtype=bool)
+    if op == 'endswith':
+        return values.str.endswith(value).to_numpy(dtype=bool)
+    # Regexes only run on the values that contain their required literal
+    hits = np.zeros(len(values), dtype=bool)
+    literal = _required_literal(value)
+    candidates = values[values.str.contains(literal, regex=False).to_numpy(dtype=bool)] if literal else values
+    if len(candidates):
+        hits[candidates.index] = candidates.str.contains(value, case=False, regex=True).to_numpy(dtype=bool)
+    return hits
+
+
+def evaluate_rules(df, rules, ipv4_columns=()):
+    """Evaluate rules over a frame, returning ({rule id: matching row positions}, per-rule summary table)
+
+    Tests are grouped by field: each column is factorized and lowercased once, every
+    distinct (op, value) test runs once over its distinct values however many rules
+    use it, and rules are then combined from sparse row-position sets.
+    """
+    text_columns = [col for col in df.columns if is_text_column(df[col]) or col in ipv4_columns]
+    atoms = {}
+    for rule in rules:
+        for field, op, values, _ in rule['clauses']:
+            for value in values:
+                atoms.setdefault(field, {}).setdefault((op, value), []).append(rule['id'])
+    
+    atom_rows, atom_seconds = {}, {}
+    for field, tests in atoms.items():
+        columns = text_columns if field is None else [field] if field in df.columns else []
+        for col in columns:
+            codes, uniques = pd.factorize(df[col])
+            if col in ipv4_columns:
+                uniques = unpack_ipv4(uniques)
+            values = _rule_values(uniques)
+            for (op, value), users in tests.items():
+                started = time.perf_counter()
+                hit_codes = np.flatnonzero(_match_atom(values, op, value))
+                rows = np.flatnonzero(np.isin(codes, hit_codes)) if len(hit_codes) else np.empty(0, np.intp)
+                key = (field, op, value)
+                atom_rows[key] = np.union1d(atom_rows[key], rows) if key in atom_rows else rows
+                # Shared tests charge their time evenly to the rules that use them
+                for rule_id in users:
+                    atom_seconds[rule_id] = atom_seconds.get(rule_id, 0.0) + (time.perf_counter() - started) / len(users)
+    
+    hits, summary = {}, []
+    empty = np.empty(0, np.intp)
+    universe = np.arange(len(df))
+    for rule in rules:
+        started = time.perf_counter()
+        # Clauses of a selection must all match; the condition then combines the selections
+        selection_rows = {}
+        for name, clauses in rule['selections'].items():
+            rows = None
+            for field, op, values, match_all in clauses:
+                parts = [atom_rows.get((field, op, value), empty) for value in values]
+                clause_rows = functools.reduce(np.intersect1d if match_all else np.union1d, parts)
+                rows = clause_rows if rows is None else np.intersect1d(rows, clause_rows, assume_unique=True)
+            selection_rows[name] = rows
+        rows = _rule_rows(rule['condition'], selection_rows, universe)
+        hits[rule['id']] = rows
+        seconds = atom_seconds.get(rule['id'], 0.0) + time.perf_counter() - started
+        summary.append({
+            'Rule': rule['id'],
+            'Title': rule['title'],
+            'Level': rule['level'],
+            'Fields': ', '.join(sorted({field or 'any text' for field, *_ in rule['clauses']})),
+            'Matches': len(rows),
+            'Time (ms)': seconds * 1000,
+        })
+    return hits, pd.DataFrame(summary)
+
+
+def _stix_indicators(objects):
+    """Indicator values from STIX 2 indicator patterns or cyber-observable objects"""
+    values = []
+    for obj in objects:
+        if not isinstance(obj, dict):
+            values.append(obj)
+        elif obj.get('type') == 'indicator' and 'pattern' in obj:
+            values.extend(STIX_PATTERN.findall(obj['pattern']))
+        elif 'value' in obj or 'indicator' in obj:
+            values.append(obj.get('value', obj.get('indicator')))
+    return values
+
+
+def load_ioc_feed(data, source):
+    """Parse a CSV/TXT (indicator in the first or 'indicator'/'value' column) or STIX-lite JSON feed
+
+    Returns a frame of normalised indicators with the type their shape implies (cidr,
+    ipv4, domain, url or hash) and their source; unrecognised entries are dropped.
+    """
+    if source.endswith('.json'):
+        content = json.loads(data)
+        objects = content.get('objects', content.get('indicators', [])) if isinstance(content, dict) else content
+        indicators = pd.Series(_stix_indicators(objects), dtype=object)
+    else:
+        feed = pd.read_csv(io.BytesIO(data), header=None, comment='#', dtype=str, skip_blank_lines=True)
+        header = feed.iloc[0].astype(str).str.strip().str.lower() if len(feed) else pd.Series(dtype=str)
+        named = header[header.isin(['indicator', 'value', 'ioc'])]
+        indicators = feed.iloc[1:, named.index[0]] if len(named) else feed.iloc[:, 0] if len(feed) else pd.Series(dtype=object)
+    
+    indicators = indicators.dropna().astype(str).str.strip().str.lower().reset_index(drop=True)
+    types = pd.Series(None, index=indicators.index, dtype=object)
+    for kind, pattern in IOC_TYPE_PATTERNS.items():
+        types[types.isna() & indicators.str.match(pattern)] = kind
+    feed = pd.DataFrame({'indicator': indicators, 'type': types, 'source': source}).dropna(subset=['type'])
+    return feed.drop_duplicates(subset=['indicator']).reset_index(drop=True)
+
+
+def load_ioc_dir(path=IOC_FEEDS_DIR):
+    """Feeds from every .csv/.txt/.json file in a directory, plus (file name, error) for feeds that failed"""
+    feeds, errors = [], []
+    if not path or not os.path.isdir(path):
+        return feeds, errors
+    for name in sorted(os.listdir(path)):
+        if name.endswith(('.csv', '.txt', '.json')):
+            try:
+                with open(os.path.join(path, name), 'rb') as f:
+                    feeds.append(load_ioc_feed(f.read(), name))
+            except Exception as e:
+                errors.append((name, str(e)))
+    return feeds, errors
+
+
+def _ipv4_ranges(indicators):
+    """(start, end, valid) for IPv4 addresses and CIDR blocks given as strings; valid flags parseable entries"""
+    parts = indicators.str.partition('/')
+    address_text = parts[0].to_numpy(dtype=object)
+    prefixes = pd.to_numeric(parts[2], errors='coerce').fillna(32).clip(0, 32).to_numpy(np.int64)
+    valid = np.ones(len(indicators), dtype=bool)
+    addresses = _ipv4_strings_to_int(address_text)
+    if addresses is None:
+        # Some entries have out-of-range octets: drop them rather than the whole feed
+        valid = pd.Series(address_text).str.split('.', expand=True).astype(int).le(255).all(axis=1).to_numpy()
+        addresses = _ipv4_strings_to_int(address_text[valid])
+        prefixes = prefixes[valid]
+    host_bits = (np.uint64(1) << (32 - prefixes).astype(np.uint64)) - np.uint64(1)
+    starts = addresses.astype(np.uint64) & ~host_bits & np.uint64(0xFFFFFFFF)
+    return starts, starts | host_bits, valid
+
+
+def build_ioc_index(feeds):
+    """Compact lookup structure for IOC feeds: merged sorted IPv4 ranges plus a sorted hash table of exact indicators"""
+    feed = pd.concat(feeds, ignore_index=True) if feeds else pd.DataFrame(columns=['indicator', 'type', 'source'])
+    index = {'size': len(feed), 'sources': sorted(feed['source'].unique().tolist())}
+    
+    ips = feed[feed['type'].isin(['ipv4', 'cidr'])]
+    if len(ips):
+        starts, ends, valid = _ipv4_ranges(ips['indicator'])
+        sources = ips['source'].to_numpy(dtype=object)[valid]
+    else:
+        starts, ends, sources = np.empty(0, np.uint64), np.empty(0, np.uint64), np.empty(0, object)
+    order = np.argsort(starts, kind='stable')
+    starts, ends, sources = starts[order], ends[order], sources[order]
+    # Merge overlapping or adjacent ranges so lookups are a single binary search
+    reach = np.maximum.accumulate(ends) if len(ends) else ends
+    new_group = np.ones(len(starts), dtype=bool)
+    new_group[1:] = starts[1:] > reach[:-1] + np.uint64(1)
+    last = np.append(np.flatnonzero(new_group)[1:] - 1, len(starts) - 1) if len(starts) else np.empty(0, np.intp)
+    index['ip_starts'] = starts[new_group]
+    index['ip_ends'] = reach[last]
+    index['ip_sources'] = sources[new_group]
+    
+    exact = feed[feed['type'].isin(['domain', 'url', 'hash'])]
+    hashes = pd.util.hash_array(exact['indicator'].to_numpy(dtype=object), categorize=False)
+    order = np.argsort(hashes)
+    index['exact_hashes'] = hashes[order]
+    for key in ('indicator', 'type', 'source'):
+        index[f'exact_{key}s'] = exact[key].to_numpy(dtype=object)[order]
+    return index
+
+
+def _lookup_ip_ranges(index, addresses):
+    """Positions of the index ranges containing each address, -1 where none does"""
+    positions = np.searchsorted(index['ip_starts'], addresses.astype(np.uint64), side='right') - 1
+    inside = (positions >= 0) & (addresses.astype(np.uint64) <= index['ip_ends'][np.maximum(positions, 0)]) \
+        if len(index['ip_starts']) else np.zeros(len(addresses), dtype=bool)
+    return np.where(inside, positions, -1)
+
+
+def _lookup_exact(index, values):
+    """Positions of exact indicators equal to each (lowercased) value, -1 where there is none"""
+    hashes = pd.util.hash_array(np.asarray(values, dtype=object), categorize=False)
+    positions = np.searchsorted(index['exact_hashes'], hashes)
+    found = positions < len(index['exact_hashes'])
+    found[found] = index['exact_hashes'][positions[found]] == hashes[found]
+    # Confirm the few hash hits against the indicator text
+    found[found] = index['exact_indicators'][positions[found]] == np.asarray(values, dtype=object)[found]
+    return np.where(found, positions, -1)
+
+
+def match_iocs(df, index, ipv4_columns=()):
+    """Join every IP and text column against an IOC index on its distinct values
+
+    Returns a table of matched indicators (column, indicator, type, source, events) and
+    {column: matching row positions}.
+    """
+    records, hits = [], {}
+    for col in df.columns:
+        if col not in ipv4_columns and not is_text_column(df[col]):
+            continue
+        codes, uniques = pd.factorize(df[col])
+        if not len(uniques):
+            continue
+        matched = np.zeros(len(uniques), dtype=bool)
+        kinds = np.empty(len(uniques), dtype=object)
+        sources = np.empty(len(uniques), dtype=object)
+        if col in ipv4_columns:
+            labels = None   # rendered for the hits only
+            addresses = np.asarray(uniques, dtype=np.int64)
+            ip_positions = np.arange(len(uniques))
+        else:
+            labels = pd.Series(np.asarray(uniques, dtype=object)).astype(str).str.strip().str.lower()
+            positions = _lookup_exact(index, labels.to_numpy(dtype=object))
+            matched = positions >= 0
+            kinds[matched] = index['exact_types'][positions[matched]]
+            sources[matched] = index['exact_sources'][positions[matched]]
+            # URLs in the data also match on their host against domain indicators
+            hosts = labels.str.extract(URL_HOST_PATTERN, expand=False)
+            candidates = np.flatnonzero(~matched & hosts.notna().to_numpy())
+            if len(candidates):
+                positions = _lookup_exact(index, hosts.to_numpy(dtype=object)[candidates])
+                found = candidates[positions >= 0]
+                matched[found] = True
+                kinds[found] = index['exact_types'][positions[positions >= 0]]
+                sources[found] = index['exact_sources'][positions[positions >= 0]]
+            labels = labels.to_numpy(dtype=object)
+            # Junk like 999.1.1.1 is skipped on its own rather than disabling IP matching for the column
+            keys = _ipv4_text_keys(labels)
+            ip_positions = np.flatnonzero(~matched & (keys >= 0))
+            addresses = keys[ip_positions]
+        if len(ip_positions):
+            ranges = _lookup_ip_ranges(index, addresses)
+            found = ip_positions[ranges >= 0]
+            matched[found] = True
+            kinds[found] = 'ipv4'
+            sources[found] = index['ip_sources'][ranges[ranges >= 0]]
+        
+        hit_codes = np.flatnonzero(matched)
+        if not len(hit_codes):
+            continue
+        rows = np.flatnonzero(np.isin(codes, hit_codes))
+        events = np.bincount(codes[rows], minlength=len(uniques))
+        hits[col] = rows
+        records.append(pd.DataFrame({
+            'Column': col,
+            'Indicator': labels[hit_codes] if labels is not None else unpack_ipv4(uniques[hit_codes]).to_numpy(),
+            'Type': kinds[hit_codes],
+            'Source': sources[hit_codes],
+            'Events': events[hit_codes],
+        }))
+    if not records:
+        return pd.DataFrame(columns=['Column', 'Indicator', 'Type', 'Source', 'Events']), hits
+    return pd.concat(records, ignore_index=True).sort_values('Events', ascending=False), hits
+
+
+def _inet_pton6(text):
+    try:
+        return socket.inet_pton(socket.AF_INET6, text)
+    except (OSError, ValueError):
+        return None
+
+
+def parse_ip_values(values):
+    """Parse an array of distinct strings into IP integers once, as {'version', 'high', 'low'}
+
+    version is 4 or 6 for addresses and 0 for anything else (hostnames, placeholders).
+    An IPv4 address is held in low and an IPv6 address in two 64-bit words; other
+    values carry a hash of their text in high, so equal texts share a key across files.
+    """
+    text = pd.Series(np.asarray(values, dtype=object), dtype=object).astype(str).str.strip().to_numpy(dtype=object)
+    version = np.zeros(len(text), dtype=np.uint8)
+    high = np.zeros(len(text), dtype=np.uint64)
+    low = np.zeros(len(text), dtype=np.uint64)
+    keys = _ipv4_text_keys(text)
+    version[keys >= 0] = 4
+    low[keys >= 0] = keys[keys >= 0]
+    # IPv6 has no vectorised parser; inet_pton converts each distinct value once, in C
+    candidates = np.flatnonzero((keys < 0) & pd.Series(text).str.contains(':', regex=False).to_numpy(dtype=bool))
+    packed = [_inet_pton6(value) for value in text[candidates].tolist()]
+    parsed = np.array([value is not None for value in packed], dtype=bool)
+    if parsed.any():
+        positions = candidates[parsed]
+        words = np.frombuffer(b''.join(value for value in packed if value is not None), dtype='>u8').reshape(-1, 2)
+        version[positions] = 6
+        high[positions], low[positions] = words[:, 0], words[:, 1]
+    other = version == 0
+    high[other] = pd.util.hash_array(text[other], categorize=False)
+    return {'version': version, 'high': high, 'low': low}
+
+
+def is_ip_column(series):
+    """Text column whose sample is mostly IPv4/IPv6 addresses, parsed at ingest by profile_frame"""
+    if not is_text_column(series):
+        return False
+    sample = series.dropna().head(IPV4_SAMPLE_ROWS)
+    return bool(len(sample)) and (parse_ip_values(sample)['version'] > 0).mean() >= IP_COLUMN_MIN_RATE
+
+
+def column_ip_values(series, packed_ipv4=False, parsed=None):
+    """Per-row codes into the distinct values of one file's IP column, plus those values parsed
+
+    parsed is the column's parse_ip_values result from profile_frame (same factorize
+    order), so text columns are not parsed again; values also carry their 'text'.
+    """
+    codes, uniques = pd.factorize(series)
+    if packed_ipv4:
+        low = np.asarray(uniques, dtype=np.uint64)
+        values = {'version': np.full(len(low), 4, dtype=np.uint8), 'high': np.zeros(len(low), dtype=np.uint64),
+                  'low': low}
+    else:
+        values = dict(parsed if parsed is not None else parse_ip_values(uniques))
+    values['text'] = np.asarray(uniques, dtype=object)
+    return codes, values
+
+
+def concat_ip_values(parts):
+    """Stack per-file (codes, values) from column_ip_values in row order; values may be None for absent columns"""
+    codes, values, offset = [], [], 0
+    for part_codes, part_values in parts:
+        codes.append(np.where(part_codes >= 0, part_codes + offset, -1))
+        if part_values is not None:
+            values.append(part_values)
+            offset += len(part_values['version'])
+    keys = ('version', 'high', 'low', 'text')
+    empty = {'version': np.uint8, 'high': np.uint64, 'low': np.uint64, 'text': object}
+    merged = {key: np.concatenate([part[key] for part in values]) if values else np.empty(0, dtype=empty[key])
+              for key in keys}
+    return (np.concatenate(codes) if codes else np.empty(0, dtype=np.intp)), merged
+
+
+def ip_network_ids(values, prefix=32, prefix_v6=128):
+    """Network id of each parsed distinct value, plus one representative per network
+
+    Addresses are masked to their /prefix (IPv4) or /prefix_v6 (IPv6) network with
+    numpy bit operations; each other text is a network of its own. The representative
+    dict holds the masked words, version and text per id, for network_labels.
+    """
+    version = values['version']
+    high, low = values['high'].copy(), values['low'].copy()
+    v4, v6 = version == 4, version == 6
+    low[v4] &= np.uint64((0xFFFFFFFF << (32 - prefix)) & 0xFFFFFFFF)
+    mask = ((1 << 128) - 1) ^ ((1 << (128 - prefix_v6)) - 1)
+    high[v6] &= np.uint64(mask >> 64)
+    low[v6] &= np.uint64(mask & 0xFFFFFFFFFFFFFFFF)
+    ids = pd.DataFrame({'version': version, 'high': high, 'low': low}).groupby(
+        ['version', 'high', 'low'], sort=False).ngroup().to_numpy()
+    first = np.zeros(ids.max() + 1 if len(ids) else 0, dtype=np.intp)
+    first[ids[::-1]] = np.arange(len(ids))[::-1]
+    networks = {'version': version[first], 'high': high[first], 'low': low[first], 'text': values['text'][first]}
+    return ids, networks
+
+
+def network_labels(networks, ids, prefix=32, prefix_v6=128):
+    """Render network ids from ip_network_ids as addresses, CIDR blocks or the original text"""
+    labels = networks['text'][ids].astype(object)
+    version = networks['version'][ids]
+    v4 = np.flatnonzero(version == 4)
+    if len(v4):
+        text = unpack_ipv4(networks['low'][ids][v4].astype(np.int64)).to_numpy(dtype=object)
+        labels[v4] = text if prefix == 32 else text + f"/{prefix}"
+    for i in np.flatnonzero(version == 6):
+        address = ipaddress.IPv6Address((int(networks['high'][ids[i]]) << 64) | int(networks['low'][ids[i]]))
+        labels[i] = str(address) if prefix_v6 == 128 else f"{address}/{prefix_v6}"
+    return labels
+
+
+def top_networks(codes, values, prefix=32, prefix_v6=128, n=10):
+    """Most frequent addresses or networks of an IP column, counted on integer network ids
+
+    codes and values come from column_ip_values (or concat_ip_values for a selection),
+    so changing the prefix only re-masks the parsed integers.
+    """
+    ids, networks = ip_network_ids(values, prefix, prefix_v6)
+    per_value = np.bincount(codes[codes >= 0], minlength=len(ids))
+    counts = np.bincount(ids, weights=per_value, minlength=len(networks['version'])).astype(np.int64)
+    top = np.argsort(-counts, kind='stable')[:n]
+    top = top[counts[top] > 0]
+    return pd.DataFrame({
+        'Network': network_labels(networks, top, prefix, prefix_v6),
+        'Count': counts[top],
+    })
+
+
+def top_network_pairs(source, destination, prefix=32, prefix_v6=128, n=10):
+    """Most frequent (source, destination) address or network pairs, counted on one combined integer key
+
+    source and destination are (codes, values) pairs as taken by top_networks.
+    """
+    source_ids, source_networks = ip_network_ids(source[1], prefix, prefix_v6)
+    dest_ids, dest_networks = ip_network_ids(destination[1], prefix, prefix_v6)
+    valid = (source[0] >= 0) & (destination[0] >= 0)
+    width = max(len(dest_networks['version']), 1)
+    pairs = source_ids[source[0][valid]].astype(np.int64) * width + dest_ids[destination[0][valid]]
+    counts = pd.Series(pairs).value_counts().head(n)
+    pair_keys = counts.index.to_numpy(dtype=np.int64)
+    return pd.DataFrame({
+        'Source': network_labels(source_networks, pair_keys // width, prefix, prefix_v6),
+        'Destination': network_labels(dest_networks, pair_keys % width, prefix, prefix_v6),
+        'Count': counts.to_numpy(),
+    })
+
+
+def iter_csv_chunks(file, chunk_rows=CSV_CHUNK_ROWS, encoding=None):
+    """Parse a CSV upload in fixed-size row chunks, typing and compacting each chunk as it arrives
+
+    Yields (chunk, meta) pairs laid out like prepare_frame's meta. The first chunk
+    resolves the timestamp formats every later chunk is parsed with, so only one
+    chunk of raw text is alive at a time.
+    """
+    file.seek(0)
+    timestamp_formats = None
+    reader = pd.read_csv(file, chunksize=chunk_rows, encoding=encoding)
+    with reader:
+        for chunk in reader:
+            chunk = clean_column_names(chunk)
+            if timestamp_formats is None:
+                timestamp_formats = infer_timestamp_columns(chunk)
+            else:
+                for col, fmt in timestamp_formats.items():
+                    chunk[col] = convert_timestamps(chunk[col], fmt)
+            chunk, meta = compact_frame(chunk)
+            meta['timestamp_formats'] = timestamp_formats
+            yield chunk, meta
+
+
+def combine_chunks(parts):
+    """Merge compacted (chunk, meta) parts into one frame and the meta that covers them all
+
+    Categoricals are merged and IPv4 columns stay packed where every chunk packed
+    them (see concat_frames); numeric columns that widened between chunks are
+    narrowed again. Only IPv4 columns that had to be unpacked are left out of
+    'compacted_columns', so prepare_frame does not factorize the rest a second time.
+    """
+    frames = [chunk for chunk, _ in parts]
+    metas = [meta for _, meta in parts]
+    if len(frames) == 1:
+        df, ipv4_columns = frames[0], metas[0]['ipv4_columns']
+    else:
+        df, ipv4_columns = concat_frames(frames, [meta['ipv4_columns'] for meta in metas])
+        df = downcast_numeric(df)
+    unpacked = set().union(*[meta['ipv4_columns'] for meta in metas]) - set(ipv4_columns)
+    return df, {
+        'ipv4_columns': [col for col in df.columns if col in ipv4_columns],
+        'compacted_columns': [col for col in df.columns if col not in unpacked],
+        'timestamp_formats': metas[0]['timestamp_formats'],
+        'memory_before': sum(meta['memory_before'] for meta in metas),
+    }
+
+
+def read_upload(file, name, engine='streaming', chunk_rows=CSV_CHUNK_ROWS, on_chunk=None):
+    """Parse a CSV/Excel/JSON upload as (frame or None, meta of the typing already done or None)
+
+    The streaming engine types and compacts each chunk as it is read (see
+    iter_csv_chunks) and calls on_chunk(chunk, rows_so_far, ipv4_columns) per chunk.
+    """
+    if name.endswith('.csv'):
+        encoding = detect_encoding(file)
+        if engine == 'pyarrow' and pyarrow is not None:
+            return read_csv_arrow(file, encoding), None
+        if engine == 'streaming':
+            try:
+                parts, rows = [], 0
+                for chunk, meta in iter_csv_chunks(file, chunk_rows, encoding):
+                    parts.append((chunk, meta))
+                    rows += len(chunk)
+                    if on_chunk is not None:
+                        on_chunk(chunk, rows, meta['ipv4_columns'])
+            except UnicodeDecodeError:
+                # Only reached when undecodable bytes appear after the sampled prefix
+                parts = list(iter_csv_chunks(file, chunk_rows, encoding='latin1'))
+            return combine_chunks(parts) if parts else (pd.DataFrame(), None)
+        try:
+            return pd.read_csv(file, encoding=encoding), None
+        except UnicodeDecodeError:
+            file.seek(0)
+            return pd.read_csv(file, encoding='latin1'), None
+    if name.endswith('.xlsx'):
+        return pd.read_excel(file), None
+    if name.endswith('.json'):
+        return pd.read_json(file), None
+    return None, None
+
+
+def prepare_upload(file, name, file_hash, engine='streaming', chunk_rows=CSV_CHUNK_ROWS, on_chunk=None):
+    """Parse, normalise and cache one upload, returning a result dict with 'data' or 'error'"""
+    started = time.perf_counter()
+    result = {'name': name, 'hash': file_hash, 'data': None, 'meta': {}, 'profile': None, 'row_hashes': None,
+              'sensitive': [], 'error': None}
+    try:
+        df, earlier = read_upload(file, name, engine, chunk_rows, on_chunk)
+        if df is None:
+            result['error'] = "Unsupported file type"
+        elif df.empty:
+            result['error'] = "The uploaded file is empty"
+        else:
+            df, meta = prepare_frame(df, earlier)
+            meta['source_name'] = name
+            result['data'] = df
+            result['meta'] = meta
+            result['profile'] = profile_frame(df, meta['ipv4_columns'])
+            result['row_hashes'] = row_hashes(df, meta['ipv4_columns'])
+            result['sensitive'] = detect_sensitive_columns(df)
+    except Exception as e:
+        result['error'] = str(e)
+    if result['data'] is not None:
+        # The cache is only a shortcut: a failed write or eviction never fails a parsed upload
+        try:
+            store_cached_dataset(file_hash, result['data'], result['meta'], result['profile'], result['row_hashes'])
+        except Exception:
+            pass
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+
+def ingest_upload(name, data, file_hash, engine='streaming', chunk_rows=CSV_CHUNK_ROWS):
+    """Process-pool entry point: prepare an upload from its raw bytes"""
+    return prepare_upload(io.BytesIO(data), name, file_hash, engine, chunk_rows)
+
+
+def watch_targets(path):
+    """CSV files followed in watch mode: the file itself, or the *.csv files of a directory in name order"""
+    if os.path.isdir(path):
+        return sorted(entry.path for entry in os.scandir(path) if entry.is_file() and entry.name.endswith('.csv'))
+    return [path] if os.path.isfile(path) else []
+
+
+def read_appended(path, cursor=None, max_bytes=WATCH_MAX_READ_BYTES):
+    """Parse the complete lines appended to a CSV since cursor, returning (frame or None, new cursor)
+
+    The cursor records the file's identity, the byte offset read up to, its header line
+    and when it was last modified. A trailing partial line is left for the next read,
+    and a file that was replaced or truncated (log rotation) is followed again from its
+    start.
+    """
+    stat = os.stat(path)
+    identity = (stat.st_dev, stat.st_ino)
+    if cursor is None or cursor['identity'] != identity or stat.st_size < cursor['offset']:
+        cursor = {'identity': identity, 'offset': 0, 'header': None}
+    cursor = dict(cursor, modified=stat.st_mtime)
+    if stat.st_size == cursor['offset']:
+        return None, cursor
+    with open(path, 'rb') as f:
+        f.seek(cursor['offset'])
+        data = f.read(max_bytes)
+    end = data.rfind(b'\n') + 1
+    if not end:
+        if len(data) == max_bytes:
+            raise ValueError(f"A line is longer than {max_bytes:,} bytes")
+        return None, cursor
+    cursor = dict(cursor, offset=cursor['offset'] + end)
+    data = data[:end]
+    if cursor['header'] is None:
+        header, _, data = data.partition(b'\n')
+        cursor['header'] = header + b'\n'
+    if not data.strip():
+        return None, cursor
+    df = pd.read_csv(io.BytesIO(cursor['header'] + data), encoding='utf-8-sig', encoding_errors='replace')
+    return df, cursor
+
+
+def watch_batch(df, patterns=THREAT_PATTERNS, rollup_freq=WATCH_ROLLUP_FREQ):
+    """Prepare one batch of appended rows with the mergeable summaries watch mode keeps for it"""
+    df, meta = prepare_frame(df)
+    masks = np.zeros(len(df), dtype=np.uint64)
+    for col in df.columns:
+        if is_text_column(df[col]):
+            masks |= match_signatures(df[col], patterns)
+    time_cols = [col for col in df.columns if pd.api.types.is_datetime64_any_dtype(df[col])]
+    if time_cols:
+        timeline = df[time_cols[0]].dt.floor(rollup_freq).value_counts()
+    else:
+        timeline = pd.Series(dtype='int64')
+    # Running (count, mean, M2) of each numeric column, added to and removed from the window totals
+    moments = {}
+    for col in df.columns:
+        series = df[col]
+        if col in meta['ipv4_columns'] or pd.api.types.is_bool_dtype(series) or not pd.api.types.is_numeric_dtype(series):
+            continue
+        values = series.dropna().to_numpy(dtype=np.float64)
+        mean = float(values.mean()) if len(values) else 0.0
+        moments[col] = {'count': len(values), 'mean': mean, 'm2': float(np.square(values - mean).sum())}
+    return {
+        'data': df,
+        'meta': meta,
+        'moments': moments,
+        'timeline': timeline,
+        'signature_hits': signature_counts(masks, list(patterns)),
+        'arrived': time.time(),
+    }
+
+
+def score_batch(batch, moments, threshold):
+    """Flag rows of a batch whose numeric values lie more than threshold σ from the window's mean"""
+    df = batch['data']
+    flagged = np.zeros(len(df), dtype=bool)
+    counts = {}
+    for col in batch['moments']:
+        if col not in moments:
+            continue
+        mean, std = profile_moments(moments[col])
+        if not std > 0:
+            continue
+        values = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        with np.errstate(invalid='ignore'):
+            outside = np.abs(values - mean) > threshold * std
+        counts[col] = int(outside.sum())
+        flagged |= outside
+    batch['anomalies'] = counts
+    batch['anomaly_rows'] = df[flagged].head(WATCH_ANOMALY_SAMPLE_ROWS)
+
+
+def new_watch_state(path):
+    """Empty watch-mode state for a file or directory (see poll_watch)"""
+    return {
+        'path': path,
+        'cursors': {},
+        'finished': set(),
+        'batches': [],
+        'moments': {},
+        'rows': 0,
+        'timeline': pd.Series(dtype='int64'),
+        'signature_hits': {},
+        'anomalies': {},
+        'errors': [],
+    }
+
+
+def _apply_moments(state, batch, sign):
+    """Add (sign=1) or remove (sign=-1) a batch's column moments from the window totals"""
+    for col, part in batch['moments'].items():
+        total = state['moments'].get(col, {'count': 0, 'mean': 0.0, 'm2': 0.0})
+        if sign > 0:
+            mean, m2 = merge_moments([total, part])
+        else:
+            mean, m2 = remove_moments(total, part)
+        state['moments'][col] = {'count': total['count'] + sign * part['count'], 'mean': mean, 'm2': m2}
+
+
+def _apply_batch(state, batch, sign):
+    """Add (sign=1) or remove (sign=-1) a batch's counters from the window totals"""
+    state['rows'] += sign * len(batch['data'])
+    timeline = state['timeline'].add(sign * batch['timeline'], fill_value=0)
+    state['timeline'] = timeline[timeline != 0].astype('int64')
+    for key in ('signature_hits', 'anomalies'):
+        for name, count in batch[key].items():
+            state[key][name] = state[key].get(name, 0) + sign * count
+
+
+def poll_watch(state, patterns=THREAT_PATTERNS, threshold=3.0, retention_seconds=WATCH_RETENTION_MINUTES * 60,
+               max_bytes=WATCH_MAX_READ_BYTES):
+    """Read what was appended to the watched files, summarise it and evict batches past the retention window
+
+    Row counts, time rollups, signature hits, anomaly counts and the (count, mean, M2)
+    of each numeric column are kept as window totals that new batches add to and
+    evicted batches subtract from, so a refresh costs the same however many batches
+    the window holds. New rows are scored against the window they arrive in. In a
+    directory, files that were deleted are forgotten, and files left unchanged for the
+    whole retention window are treated as finished and no longer checked. Returns the
+    new batches.
+    """
+    horizon = time.time() - retention_seconds
+    while state['batches'] and state['batches'][0]['arrived'] < horizon:
+        batch = state['batches'].pop(0)
+        _apply_moments(state, batch, -1)
+        _apply_batch(state, batch, -1)
+    if not state['batches']:
+        state['moments'] = {}   # start the next window from exact totals
+    
+    targets = watch_targets(state['path'])
+    present = set(targets)
+    state['cursors'] = {path: cursor for path, cursor in state['cursors'].items() if path in present}
+    state['finished'] &= present
+    rotating = os.path.isdir(state['path'])
+    
+    new, state['errors'] = [], []
+    for path in targets:
+        if path in state['finished']:
+            continue
+        try:
+            df, state['cursors'][path] = read_appended(path, state['cursors'].get(path), max_bytes)
+            if df is None or df.empty:
+                if rotating and state['cursors'][path]['modified'] < horizon:
+                    state['finished'].add(path)
+                    del state['cursors'][path]
+                continue
+            batch = watch_batch(df, patterns)
+        except Exception as e:
+            state['errors'].append((os.path.basename(path), str(e)))
+            continue
+        batch['source'] = os.path.basename(path)
+        _apply_moments(state, batch, 1)
+        score_batch(batch, state['moments'], threshold)
+        _apply_batch(state, batch, 1)
+        state['batches'].append(batch)
+        new.append(batch)
+    return new
+
+
+def watch_snapshot(state):
+    """The rows currently in the watch window as one prepared frame with its meta"""
+    frames = [batch['data'] for batch in state['batches']]
+    metas = [batch['meta'] for batch in state['batches']]
+    df, ipv4_columns = concat_frames(frames, [meta['ipv4_columns'] for meta in metas])
+    timestamp_formats = {}
+    for meta in metas:
+        timestamp_formats.update(meta['timestamp_formats'])
+    meta = {
+        'ipv4_columns': ipv4_columns,
+        'memory_before': sum(meta['memory_before'] for meta in metas),
+        'memory_after': int(df.memory_usage(deep=True).sum()),
+        'timestamp_formats': timestamp_formats,
+        'version': PREPARED_FRAME_VERSION,
+        'source_name': os.path.basename(os.path.normpath(state['path'])),
+    }
+    return df, meta